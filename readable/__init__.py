@@ -1,5 +1,5 @@
 
-from core import Readable, __version__, UPSTREAM_VERSION
+from readable.core import Readable, __version__, UPSTREAM_VERSION
 
 
 
@@ -0,0 +1,113 @@
+"""
+asyncio front end for readable. Requires Python 3.7 or later.
+
+Extraction is CPU bound, so AsyncReadable runs it in an executor to keep the
+event loop responsive, and bounds both the number of extractions running at
+once and the number of documents read ahead of the consumer:
+
+    extractor = AsyncReadable(concurrency=4)
+    html = await extractor.extract(page)
+
+    async for res in extractor.extract_iter(fetch_pages()):
+        store(res.index, res.content or res.error)
+"""
+
+# std
+import asyncio
+import collections
+import traceback
+import weakref
+
+# local
+from readable.core import Readable, Result
+
+
+class AsyncReadable(object):
+
+    """
+    Run 'Readable.extract' from coroutines.
+
+    'readable' is the configured Readable to use, shared by all calls.
+    'executor' is a concurrent.futures executor to run extractions in,
+    defaulting to the event loop's thread pool; a ProcessPoolExecutor avoids
+    contention on the GIL. At most 'concurrency' extractions are submitted to
+    the executor at any time, and 'extract_iter' reads at most 'queue_size'
+    documents ahead of its consumer.
+    """
+
+    def __init__(self, readable=None, executor=None, concurrency=4,
+            queue_size=None):
+        self.readable = readable or Readable()
+        self.executor = executor
+        self.concurrency = concurrency
+        self.queue_size = queue_size or concurrency * 2
+        # the concurrency limit, per event loop it is used from
+        self.semaphores = weakref.WeakKeyDictionary()
+
+    async def extract(self, data, output='html'):
+        "Extract 'data' in the executor and return the serialized content."
+        loop = asyncio.get_running_loop()
+        semaphore = self.semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            self.semaphores[loop] = semaphore
+        async with semaphore:
+            return await loop.run_in_executor(self.executor,
+                self.readable.extract, data, output)
+
+    async def extract_result(self, index, data, output='html'):
+        "Extract 'data', capturing any error in the returned Result."
+        try:
+            return Result(index, await self.extract(data, output), None)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return Result(index, None, traceback.format_exc())
+
+    async def extract_iter(self, documents, output='html', ordered=True):
+        """
+        Asynchronously yield a Result for each document of 'documents', an
+        iterable or async iterable of HTML strings. Results come in input
+        order if 'ordered' is set, otherwise as soon as they are ready. A new
+        document is only read when fewer than 'queue_size' are pending, which
+        pushes back on the producer. Closing or cancelling the iteration
+        cancels the pending extractions.
+        """
+        if hasattr(documents, '__aiter__'):
+            source = documents.__aiter__()
+        else:
+            source = _aiter(documents)
+        pending = collections.deque()
+        index = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < self.queue_size:
+                    try:
+                        data = await source.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    pending.append(asyncio.ensure_future(
+                        self.extract_result(index, data, output)))
+                    index += 1
+                if not pending:
+                    return
+                if ordered:
+                    yield await pending.popleft()
+                    continue
+                done, _ = await asyncio.wait(pending,
+                    return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.remove(task)
+                for res in sorted(task.result() for task in done):
+                    yield res
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+async def _aiter(iterable):
+    "Wrap a plain iterable into an async iterator."
+    for item in iterable:
+        yield item
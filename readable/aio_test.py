@@ -0,0 +1,91 @@
+
+
+# std
+import asyncio
+import concurrent.futures
+import os
+import unittest
+
+# local
+from readable import aio
+from readable import core
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_data(name):
+    path = os.path.join(ROOT, 'testdata', name)
+    with open(path, 'rb') as fh:
+        return fh.read()
+
+
+class TestAsyncReadable(unittest.TestCase):
+
+    def setUp(self):
+        self.docs = [get_data('article.html'), b'',
+            get_data('breaks_t.html')] * 3
+        rb = core.Readable()
+        self.exp = [rb.extract(d, 'text') if d else None for d in self.docs]
+
+    def test_extract(self):
+        extractor = aio.AsyncReadable()
+
+        async def run():
+            return await asyncio.gather(*[extractor.extract(d, 'text')
+                for d in self.docs if d])
+
+        self.assertEqual(asyncio.run(run()), [e for e in self.exp if e])
+
+    def test_extract_iter(self):
+        read = []
+
+        async def source():
+            for d in self.docs:
+                read.append(d)
+                yield d
+
+        async def run(extractor, documents, ordered):
+            res = []
+            async for r in extractor.extract_iter(documents, 'text',
+                    ordered=ordered):
+                # never more than 'queue_size' documents read ahead
+                self.assertTrue(len(read) - len(res) <= extractor.queue_size)
+                res.append(r)
+            return res
+
+        with concurrent.futures.ProcessPoolExecutor(2) as pool:
+            for executor in (None, pool):
+                extractor = aio.AsyncReadable(executor=executor,
+                    concurrency=2, queue_size=3)
+                for ordered in (True, False):
+                    del read[:]
+                    res = asyncio.run(run(extractor, source(), ordered))
+                    if not ordered:
+                        res.sort()
+                    self.assertEqual([r.index for r in res],
+                        list(range(len(self.docs))))
+                    self.assertEqual([r.content for r in res], self.exp)
+                    self.assertTrue('Document is empty' in res[1].error)
+        del read[:]
+        res = asyncio.run(run(aio.AsyncReadable(), self.docs, True))
+        self.assertEqual([r.content for r in res], self.exp)
+
+    def test_cancel(self):
+        extractor = aio.AsyncReadable(concurrency=1, queue_size=4)
+
+        async def run():
+            results = extractor.extract_iter(self.docs)
+            first = await results.__anext__()
+            await results.aclose()
+            return first
+
+        self.assertEqual(asyncio.run(run()).index, 0)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
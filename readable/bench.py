@@ -0,0 +1,349 @@
+"""
+readable benchmarks.
+
+Times each extraction stage, and measures its peak memory where tracemalloc
+is available (Python 3), on two sets of pages: synthetic pages generated with
+a controlled size and shape, and the real article layouts checked in under
+testdata/corpus. Stage times include the stages they call, e.g. the time of
+'prep_document' includes 'clean_document'.
+
+    python -m readable.bench                   # print a table
+    python -m readable.bench --json out.json   # also save the results
+    python -m readable.bench --compare out.json
+
+With '--compare', stages that got slower than the saved results by more
+than the threshold are listed and the exit status is 1.
+"""
+
+# std
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import time
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# vendor
+import lxml.etree
+import lxml.html
+
+# local
+from readable.core import Readable, __version__, UPSTREAM_VERSION
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(ROOT, 'testdata', 'corpus')
+
+STAGES = ('prep_document', 'clean_document', 'select_scorable', 'score_nodes',
+    '_select_top', 'prep_article')
+
+WORDS = ('the of and to in is was that for on with as by at from this have '
+    'are be which one all were had they been their has more would when '
+    'there city council line work water light year people time house road '
+    'station report market design garden river paper story evening').split()
+
+NEUTRAL = ('', '', 'wrapper', 'inner', 'section', 'block', 'region')
+UNLIKELY = ('comment', 'sidebar', 'footer', 'menu', 'sponsor', 'popup',
+    'share-tweet', 'shoutbox')
+
+# name, generator arguments
+SYNTHETIC = [
+    ('small', dict(paragraphs=20)),
+    ('large', dict(paragraphs=1000)),
+    ('deep', dict(paragraphs=200, depth=60)),
+    ('breaks', dict(paragraphs=300, br_density=0.8)),
+    ('links', dict(paragraphs=300, link_density=0.6)),
+    ('unlikely', dict(paragraphs=300, unlikely_ratio=0.6)),
+    ]
+
+
+def generate(paragraphs=50, depth=3, br_density=0.1, link_density=0.1,
+        unlikely_ratio=0.1, seed=0):
+    """
+    Return a synthetic HTML page with 'paragraphs' paragraphs of text, nested
+    'depth' wrapper divs deep. 'br_density' is the share of paragraphs
+    written as <br> separated text rather than <p>, 'link_density' the share
+    of words inside links, and 'unlikely_ratio' the share of blocks marked
+    with a class that readability considers unlikely to be content.
+    """
+    rnd = random.Random(seed)
+
+    def words(n):
+        out = []
+        for i in range(n):
+            word = rnd.choice(WORDS)
+            if rnd.random() < 0.08:
+                word += ','
+            if rnd.random() < link_density:
+                word = '<a href="/%s">%s</a>' % (word.strip(','), word)
+            out.append(word)
+        return ' '.join(out) + '.'
+
+    def wrap(html, classes):
+        cls = rnd.choice(classes)
+        if cls:
+            return '<div class="%s">%s</div>' % (cls, html)
+        return '<div>%s</div>' % html
+
+    blocks = []
+    run = []
+    for i in range(paragraphs):
+        text = ' '.join(words(rnd.randint(8, 30)) for j in range(3))
+        if rnd.random() < br_density:
+            run.append(text)
+            continue
+        if run:
+            blocks.append('<div>%s<br><br></div>' % '<br><br>\n'.join(run))
+            run = []
+        blocks.append('<p>%s</p>' % text)
+    if run:
+        blocks.append('<div>%s</div>' % '<br><br>\n'.join(run))
+
+    body = []
+    for block in blocks:
+        if rnd.random() < unlikely_ratio:
+            block = wrap(block, UNLIKELY)
+        body.append(block)
+    html = '\n'.join(body)
+    for i in range(depth):
+        html = wrap(html, NEUTRAL)
+    nav = ''.join('<li><a href="/%d">%s</a></li>' % (i, rnd.choice(WORDS))
+        for i in range(12))
+    return ('<!DOCTYPE html><html><head><title>Synthetic page %d</title>'
+        '<script>var x = 1;</script></head><body><div id="header">'
+        '<ul class="menu">%s</ul></div>%s<div id="footer">%s</div>'
+        '</body></html>' % (seed, nav, html, words(20)))
+
+
+def pages(synthetic=True, corpus=True):
+    "Return a list of (name, data) pairs to benchmark."
+    out = []
+    if synthetic:
+        for name, kwargs in SYNTHETIC:
+            out.append(('synthetic/' + name, generate(**kwargs)))
+    if corpus:
+        for path in sorted(glob.glob(os.path.join(CORPUS, '*.html'))):
+            fh = open(path, 'rb')
+            try:
+                data = fh.read()
+            finally:
+                fh.close()
+            out.append(('corpus/' + os.path.basename(path), data))
+    return out
+
+
+class StageTimer(object):
+
+    """
+    Record the time, and optionally the peak memory, of each stage method
+    called on the Readable contexts it instruments.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stats = {}
+        # for each stage being run: traced memory at entry, highest peak seen
+        self.frames = []
+
+    def instrument(self, ctx):
+        for stage in STAGES:
+            setattr(ctx, stage, self.wrap(stage, getattr(ctx, stage)))
+
+    def wrap(self, stage, func):
+        # nested calls of a stage count as one call
+        active = []
+
+        def timed(*args, **kwargs):
+            if active:
+                return func(*args, **kwargs)
+            active.append(stage)
+            self.enter()
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.leave(stage, time.time() - start)
+                active.pop()
+        return timed
+
+    def enter(self):
+        if not self.memory:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        if self.frames:
+            frame = self.frames[-1]
+            frame[1] = max(frame[1], peak)
+        tracemalloc.reset_peak()
+        self.frames.append([current, current])
+
+    def leave(self, stage, seconds):
+        rec = self.stats.setdefault(stage, {'calls': 0, 'seconds': 0.0})
+        rec['calls'] += 1
+        rec['seconds'] += seconds
+        if not self.memory:
+            return
+        base, seen = self.frames.pop()
+        peak = max(seen, tracemalloc.get_traced_memory()[1])
+        rec['peak_bytes'] = max(rec.get('peak_bytes', 0), peak - base)
+        if self.frames:
+            frame = self.frames[-1]
+            frame[1] = max(frame[1], peak)
+
+
+class ProfiledReadable(Readable):
+
+    "A Readable whose extraction contexts report to a StageTimer."
+
+    def __init__(self, timer, **kwargs):
+        Readable.__init__(self, **kwargs)
+        self.timer = timer
+
+    def context(self):
+        ctx = Readable.context(self)
+        self.timer.instrument(ctx)
+        return ctx
+
+
+def measure(data, repeat=3):
+    """
+    Extract 'data' 'repeat' times and return the best time of each stage,
+    plus the peak memory of each stage from one extra traced run.
+    """
+    best = {}
+    for i in range(repeat):
+        timer = StageTimer()
+        rb = ProfiledReadable(timer)
+        timer.enter()
+        start = time.time()
+        rb.grab_article(data)
+        timer.leave('grab_article', time.time() - start)
+        for stage, rec in timer.stats.items():
+            if stage not in best or rec['seconds'] < best[stage]['seconds']:
+                best[stage] = rec
+    if tracemalloc is not None and hasattr(tracemalloc, 'reset_peak'):
+        timer = StageTimer(memory=True)
+        tracemalloc.start()
+        try:
+            timer.enter()
+            ProfiledReadable(timer).grab_article(data)
+            timer.leave('grab_article', 0.0)
+        finally:
+            tracemalloc.stop()
+        for stage, rec in timer.stats.items():
+            best[stage]['peak_bytes'] = rec['peak_bytes']
+    return best
+
+
+def run(pages, repeat=3):
+    "Benchmark every (name, data) pair in 'pages' and return a report."
+    report = {
+        'version': __version__,
+        'upstream_version': UPSTREAM_VERSION,
+        'python': platform.python_version(),
+        'lxml': '.'.join(str(v) for v in lxml.etree.LXML_VERSION),
+        'repeat': repeat,
+        'pages': [],
+        }
+    for name, data in pages:
+        nodes = sum(1 for n in lxml.html.fromstring(data).iter())
+        report['pages'].append({
+            'name': name,
+            'bytes': len(data),
+            'nodes': nodes,
+            'stages': measure(data, repeat),
+            })
+    return report
+
+
+def compare(report, baseline, threshold=1.25, floor=0.001):
+    """
+    Return a description of each stage that is more than 'threshold' times
+    slower in 'report' than in 'baseline'. Stages faster than 'floor'
+    seconds in the baseline are too noisy to compare and are skipped.
+    """
+    old = dict((page['name'], page['stages']) for page in baseline['pages'])
+    out = []
+    for page in report['pages']:
+        stages = old.get(page['name'], {})
+        for stage, rec in sorted(page['stages'].items()):
+            prev = stages.get(stage)
+            if prev is None or prev['seconds'] < floor:
+                continue
+            ratio = rec['seconds'] / prev['seconds']
+            if ratio > threshold:
+                out.append('%s %s: %.2fms -> %.2fms (x%.2f)' % (page['name'],
+                    stage, prev['seconds'] * 1e3, rec['seconds'] * 1e3,
+                    ratio))
+    return out
+
+
+def format_report(report):
+    "Return a plain text table of 'report'."
+    cols = ('grab_article',) + STAGES
+    lines = ['%-30s %8s %7s ' % ('page', 'bytes', 'nodes') +
+        ' '.join('%13s' % c.strip('_')[:13] for c in cols)]
+    for page in report['pages']:
+        cells = []
+        for stage in cols:
+            rec = page['stages'].get(stage)
+            cells.append('%11.2fms' % (rec['seconds'] * 1e3) if rec
+                else '%13s' % '-')
+        lines.append('%-30s %8d %7d ' % (page['name'], page['bytes'],
+            page['nodes']) + ' '.join(cells))
+    return '\n'.join(lines) + '\n'
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m readable.bench',
+        description='Benchmark the readable extraction stages.')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='timed runs per page, the best is kept (default: 3)')
+    parser.add_argument('--no-synthetic', action='store_true',
+        help='skip the synthetic pages')
+    parser.add_argument('--no-corpus', action='store_true',
+        help='skip the checked-in corpus')
+    parser.add_argument('--json', metavar='FILE',
+        help="write the results as JSON to FILE, '-' for stdout")
+    parser.add_argument('--compare', metavar='FILE',
+        help='compare against results saved with --json')
+    parser.add_argument('--threshold', type=float, default=1.25,
+        help='slowdown ratio reported by --compare (default: 1.25)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    report = run(pages(not opts.no_synthetic, not opts.no_corpus),
+        opts.repeat)
+    if opts.json == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        sys.stdout.write(format_report(report))
+        if opts.json:
+            fh = open(opts.json, 'w')
+            try:
+                json.dump(report, fh, indent=2, sort_keys=True)
+            finally:
+                fh.close()
+    if opts.compare:
+        fh = open(opts.compare)
+        try:
+            baseline = json.load(fh)
+        finally:
+            fh.close()
+        regressions = compare(report, baseline, opts.threshold)
+        for line in regressions:
+            sys.stderr.write('regression: %s\n' % line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+
+
+# std
+import json
+import unittest
+
+# vendor
+import lxml.html
+
+# local
+from readable import bench
+
+
+class TestBench(unittest.TestCase):
+
+    def test_generate(self):
+        self.assertEquals(bench.generate(seed=3), bench.generate(seed=3))
+        plain = lxml.html.fromstring(bench.generate(paragraphs=40,
+            br_density=0, link_density=0, unlikely_ratio=0))
+        self.assertEquals(len(plain.xpath('//body//p')), 40)
+        self.assertEquals(len(plain.xpath('//body//br')), 0)
+        self.assertEquals(len(plain.xpath('//p//a')), 0)
+        page = lxml.html.fromstring(bench.generate(paragraphs=40, depth=10,
+            br_density=0.5, link_density=0.5, unlikely_ratio=0.5))
+        self.assertTrue(page.xpath('//body//br'))
+        self.assertTrue(page.xpath('//p//a'))
+        self.assertTrue(page.xpath('//div[@class="comment" or '
+            '@class="sidebar" or @class="footer" or @class="menu"]'))
+        depth = max(len(list(p.iterancestors())) for p in page.iter('p'))
+        self.assertTrue(depth >= 12)
+
+    def test_run(self):
+        pages = [('small', bench.generate(paragraphs=10))]
+        report = json.loads(json.dumps(bench.run(pages, repeat=1)))
+        stages = report['pages'][0]['stages']
+        self.assertEquals(sorted(stages),
+            sorted(bench.STAGES + ('grab_article',)))
+        self.assertEquals(stages['prep_document']['calls'], 1)
+        self.assertEquals(stages['clean_document']['calls'], 1)
+        self.assertTrue(bench.format_report(report).startswith('page'))
+        self.assertEquals(bench.compare(report, report), [])
+        for rec in stages.values():
+            rec['seconds'] = rec['seconds'] * 2 + 0.01
+        baseline = json.loads(json.dumps(bench.run(pages, repeat=1)))
+        self.assertEquals(len(bench.compare(report, baseline, 1.0, 0)), 7)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+readable extraction result cache.
+
+Pages fetched again are often byte for byte the same, so a Readable built
+with a cache looks up the result of 'extract' before extracting:
+
+    cache = TieredCache(MemoryCache(), SQLiteCache('readable.db'))
+    readable = Readable(cache=cache)
+    readable.extract(page)      # extracted and stored
+    readable.extract(page)      # served from the cache
+
+Results are keyed by a hash of the page, the extraction flags, the output
+mode and the readable and upstream rule versions (see 'Readable.cache_key'),
+so a new version of the rules never serves results of the old one. An
+SQLiteCache also drops its entries when opened by a different version.
+
+Any object with the two methods below can be used as a cache:
+
+  get(key)
+        return the unicode string stored under 'key', or None.
+
+  put(key, value)
+        store the unicode string 'value' under 'key'.
+
+Each cache here is bounded by the total size of its values, evicting the
+least recently used entries first, and counts its 'hits' and 'misses'.
+"""
+
+# std
+import collections
+import sqlite3
+import threading
+
+# local
+from readable.core import __version__, UPSTREAM_VERSION
+
+
+VERSION = '%s/%s' % (__version__, UPSTREAM_VERSION)
+
+
+class MemoryCache(object):
+
+    """
+    A thread safe in-memory LRU cache, holding at most 'max_size' characters
+    of values. Entries are not copied into the processes of
+    'Readable.extract_many', which each start with an empty cache.
+    """
+
+    def __init__(self, max_size=64 * 1024 * 1024):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.clear()
+
+    def __getstate__(self):
+        return {'max_size': self.max_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def clear(self):
+        "Drop all entries and reset the counters."
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_size:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                key, old = self.entries.popitem(last=False)
+                self.size -= len(old)
+
+    def stats(self):
+        "Return a dict of the 'hits', 'misses', 'entries' and 'size'."
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.entries), 'size': self.size}
+
+
+class SQLiteCache(object):
+
+    """
+    A cache persisted in the SQLite database at 'path', holding at most
+    'max_size' bytes of UTF-8 encoded values. The database can be shared by
+    threads and processes. Entries stored by another 'version' of the rules
+    are dropped when the database is opened.
+    """
+
+    def __init__(self, path, max_size=1024 * 1024 * 1024, version=VERSION,
+            timeout=30):
+        self.path = path
+        self.max_size = max_size
+        self.version = version
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        state['conn'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def connect(self):
+        "Open the database, creating or resetting it as needed."
+        if self.conn is not None:
+            return self.conn
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+            isolation_level=None, check_same_thread=False)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT '
+                'PRIMARY KEY, value)')
+            conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT '
+                'PRIMARY KEY, value TEXT, size INTEGER, used INTEGER)')
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_used ON '
+                'entries (used)')
+            row = conn.execute("SELECT value FROM meta WHERE name = "
+                "'version'").fetchone()
+            if row is None or row[0] != self.version:
+                conn.execute('DELETE FROM entries')
+                conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                    [('version', self.version), ('size', 0), ('clock', 0)])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            conn.close()
+            raise
+        self.conn = conn
+        return conn
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def _tick(self, conn):
+        "Return the next value of the clock ordering entries by last use."
+        conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'clock'")
+        return conn.execute("SELECT value FROM meta WHERE name = "
+            "'clock'").fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            conn = self.connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT value FROM entries WHERE key = ?',
+                    (key,)).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE entries SET used = ? WHERE key = ?',
+                        (self._tick(conn), key))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_size:
+            return
+        with self.lock:
+            conn = self.connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT size FROM entries WHERE key = ?',
+                    (key,)).fetchone()
+                grown = size
+                if row is not None:
+                    grown -= row[0]
+                conn.execute('INSERT OR REPLACE INTO entries VALUES '
+                    '(?, ?, ?, ?)', (key, value, size, self._tick(conn)))
+                conn.execute("UPDATE meta SET value = value + ? WHERE name = "
+                    "'size'", (grown,))
+                self._evict(conn)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _evict(self, conn):
+        "Drop the least recently used entries until within 'max_size'."
+        total = conn.execute("SELECT value FROM meta WHERE name = "
+            "'size'").fetchone()[0]
+        if total <= self.max_size:
+            return
+        freed = 0
+        doomed = []
+        for key, size in conn.execute('SELECT key, size FROM entries '
+                'ORDER BY used'):
+            if total - freed <= self.max_size:
+                break
+            doomed.append((key,))
+            freed += size
+        conn.executemany('DELETE FROM entries WHERE key = ?', doomed)
+        conn.execute("UPDATE meta SET value = value - ? WHERE name = 'size'",
+            (freed,))
+
+    def stats(self):
+        "Return a dict of the 'hits', 'misses', 'entries' and 'size'."
+        with self.lock:
+            conn = self.connect()
+            entries = conn.execute('SELECT COUNT(*) FROM entries').fetchone()
+            size = conn.execute("SELECT value FROM meta WHERE name = "
+                "'size'").fetchone()
+            return {'hits': self.hits, 'misses': self.misses,
+                'entries': entries[0], 'size': size[0]}
+
+
+class TieredCache(object):
+
+    """
+    Look values up in each cache of 'tiers' in turn, fastest first, copying
+    a value found in a slower tier into the faster ones. Values are stored
+    in every tier. A hit is counted when any tier has the value.
+    """
+
+    def __init__(self, *tiers):
+        self.tiers = tiers
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.put(key, value)
+                with self.lock:
+                    self.hits += 1
+                return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        for tier in self.tiers:
+            tier.put(key, value)
+
+    def stats(self):
+        "Return a dict of the 'hits' and 'misses', and the stats of 'tiers'."
+        return {'hits': self.hits, 'misses': self.misses,
+            'tiers': [tier.stats() for tier in self.tiers]}
@@ -0,0 +1,147 @@
+
+
+# std
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+# local
+from readable import cache
+from readable import core
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_data(name):
+    path = os.path.join(ROOT, 'testdata', name)
+    fh = open(path, 'rb')
+    data = fh.read()
+    fh.close()
+    return data
+
+
+class CountingReadable(core.Readable):
+
+    def __init__(self, **kwargs):
+        core.Readable.__init__(self, **kwargs)
+        self.calls = 0
+
+    def grab_article(self, data, url=None):
+        self.calls += 1
+        return core.Readable.grab_article(self, data, url)
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_memory(self):
+        mem = cache.MemoryCache(max_size=10)
+        mem.put('a', u'1234')
+        mem.put('b', u'1234')
+        self.assertEquals(mem.get('a'), u'1234')
+        # 'b' is the least recently used
+        mem.put('c', u'1234')
+        self.assertEquals((mem.get('a'), mem.get('b'), mem.get('c')),
+            (u'1234', None, u'1234'))
+        mem.put('d', u'x' * 11)
+        self.assertEquals(mem.get('d'), None)
+        self.assertEquals(mem.stats(), {'hits': 3, 'misses': 2,
+            'entries': 2, 'size': 8})
+        copy = pickle.loads(pickle.dumps(mem))
+        self.assertEquals((copy.max_size, copy.stats()['entries']), (10, 0))
+
+    def test_sqlite(self):
+        db = cache.SQLiteCache(self.path, max_size=10)
+        db.put('a', u'\xe9\xe9')
+        db.put('b', u'1234')
+        db.put('a', u'12')
+        self.assertEquals(db.get('b'), u'1234')
+        db.put('c', u'12345')
+        self.assertEquals(db.stats(), {'hits': 1, 'misses': 0,
+            'entries': 2, 'size': 9})
+        db.close()
+
+        # entries persist, in least recently used order
+        db = pickle.loads(pickle.dumps(cache.SQLiteCache(self.path,
+            max_size=10)))
+        self.assertEquals(db.get('a'), None)
+        db.put('d', u'1234')
+        self.assertEquals((db.get('b'), db.get('c'), db.get('d')),
+            (None, u'12345', u'1234'))
+        db.close()
+
+        # another version of the rules starts afresh
+        db = cache.SQLiteCache(self.path, version='0/0')
+        self.assertEquals(db.get('c'), None)
+        self.assertEquals(db.stats()['size'], 0)
+        db.close()
+
+    def test_tiered(self):
+        mem = cache.MemoryCache()
+        db = cache.SQLiteCache(self.path)
+        tiers = cache.TieredCache(mem, db)
+        tiers.put('a', u'value')
+        mem.clear()
+        self.assertEquals(tiers.get('a'), u'value')
+        self.assertEquals(mem.get('a'), u'value')
+        self.assertEquals(tiers.get('b'), None)
+        stats = tiers.stats()
+        self.assertEquals((stats['hits'], stats['misses']), (1, 1))
+        self.assertEquals([t['entries'] for t in stats['tiers']], [1, 1])
+        db.close()
+
+    def test_extract(self):
+        article = get_data('article.html')
+        plain = core.Readable()
+        rb = CountingReadable(cache=cache.TieredCache(cache.MemoryCache(),
+            cache.SQLiteCache(self.path)))
+        for output in core.OUTPUTS:
+            exp = plain.extract(article, output)
+            self.assertEquals(rb.extract(article, output), exp)
+            self.assertEquals(rb.extract(article, output), exp)
+        self.assertEquals(rb.calls, len(core.OUTPUTS))
+        self.assertTrue(isinstance(rb.extract(article, 'paragraphs')[0],
+            core.Paragraph))
+
+        stream = io.BytesIO()
+        rb.extract(article, 'html', stream, 'latin-1')
+        self.assertEquals(stream.getvalue(), plain.serialize(
+            plain.grab_article(article), 'html').encode('latin-1',
+            'xmlcharrefreplace'))
+        self.assertRaises(ValueError, rb.extract, article, 'paragraphs',
+            io.BytesIO())
+
+        # the key covers the input, flags and output
+        keys = set([rb.cache_key(article, 'html'),
+            rb.cache_key(article, 'text'),
+            rb.cache_key(article.decode('utf-8'), 'html'),
+            rb.cache_key(article + b' ', 'html')])
+        rb.flags = 0
+        keys.add(rb.cache_key(article, 'html'))
+        self.assertEquals(len(keys), 5)
+
+        # worker processes share the database
+        rb = core.Readable(cache=cache.SQLiteCache(self.path))
+        res = list(rb.extract_many([article] * 2, workers=2, output='text'))
+        self.assertEquals([r.content for r in res],
+            [plain.extract(article, 'text')] * 2)
+        self.assertEquals(rb.cache.stats()['entries'], len(core.OUTPUTS))
+        rb.cache.close()
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
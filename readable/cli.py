@@ -0,0 +1,434 @@
+"""
+readable command line extractor.
+
+Reads a stream of HTML records from files or stdin, extracts the readable
+content of each one and writes one JSON object per record to stdout as soon
+as it is ready. Records are read lazily, so memory use does not depend on
+the size of the input.
+
+Input formats:
+
+  jsonl     one JSON object per line, with an 'html' and optional 'url' key.
+  records   a header line 'LENGTH [URL]', followed by LENGTH bytes of HTML.
+  warc      WARC records, gzipped or not; 'response' and 'resource' records
+            are extracted, with the HTTP headers of responses skipped and
+            their transfer and content encodings undone.
+
+Output objects have the keys 'index', 'url' and either 'content' or 'error'.
+A record that cannot be read gets an 'error' too, and the records after it
+are read on: the next line of JSON lines, the next header line of records
+and the next 'WARC/' line of WARC files. Only a truncated record ends the
+reading of its file.
+With '-o paragraphs', 'content' is a list of objects with the 'text' of each
+paragraph, its 'start' and 'end' offsets in the text of the content and the
+'tag' of the block holding it.
+With '--cache FILE', results are kept in the SQLite database FILE and
+documents seen before are not extracted again. With '--metrics FILE',
+extraction metrics are written to FILE at the end of
+the run, as JSON if its name ends in '.json' and in the Prometheus text
+format otherwise.
+"""
+
+# std
+import argparse
+import collections
+import io
+import itertools
+import json
+import re
+import sys
+import time
+import zlib
+
+# local
+from readable.cache import MemoryCache, SQLiteCache, TieredCache
+from readable.core import OUTPUTS, Readable
+from readable.metrics import Metrics
+
+
+FORMATS = ('jsonl', 'records', 'warc')
+GZIP_MAGIC = b'\x1f\x8b'
+CHUNK_SIZE = 64 * 1024
+RE_CHARSET = re.compile(br'charset\s*=\s*["\']?([-\w.:]+)', re.I)
+
+
+class RecordError(ValueError):
+
+    """
+    Yielded by the readers in place of the html of a record that cannot be
+    read, before going on with the next record.
+    """
+
+
+def read_jsonl(fh):
+    "Yield (url, html) pairs from JSON lines, or (url, RecordError)."
+    for line in fh:
+        line = line.strip()
+        if not line:
+            continue
+        url = None
+        try:
+            rec = json.loads(line.decode('utf-8'))
+            url = rec.get('url')
+            yield url, rec['html']
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            yield url, RecordError('bad record: %s' % (describe(exc),))
+
+
+def read_records(fh):
+    "Yield (url, html) pairs from length-prefixed records, or (url, error)."
+    # after a bad header, lines are skipped up to the next header
+    resync = False
+    while True:
+        line = fh.readline()
+        if not line:
+            return
+        parts = line.split(None, 1)
+        if not parts:
+            continue
+        try:
+            size = int(parts[0])
+            if size < 0:
+                raise ValueError('negative length %d' % size)
+            url = None
+            if len(parts) > 1:
+                url = parts[1].strip().decode('utf-8')
+        except ValueError as exc:
+            if not resync:
+                resync = True
+                yield None, RecordError('bad record header: %s' %
+                    (describe(exc),))
+            continue
+        resync = False
+        data = fh.read(size)
+        if len(data) < size:
+            yield url, RecordError('truncated record')
+            return
+        yield url, data
+
+
+def describe(exc):
+    "Return the message of 'exc', with its type when that says more."
+    if isinstance(exc, KeyError):
+        return 'missing key %s' % (exc,)
+    return str(exc) or type(exc).__name__
+
+
+class WarcStream(object):
+
+    """
+    The bytes of the WARC file 'fh', decompressed as they are read when it
+    is gzipped, as .warc.gz files are, one gzip member per record. Has the
+    'read' and 'readline' methods 'read_warc' uses.
+    """
+
+    def __init__(self, fh):
+        self.fh = fh
+        # bytes read and not yet returned
+        self.buf = bytearray()
+        # compressed bytes not yet decompressed, when gzipped
+        self.pending = fh.read(CHUNK_SIZE)
+        self.inflate = None
+        if self.pending.startswith(GZIP_MAGIC):
+            self.inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self.buf.extend(self.pending)
+            self.pending = b''
+
+    def fill(self):
+        "Add more bytes to 'buf', returning False at the end of the file."
+        if self.inflate is None:
+            data = self.fh.read(CHUNK_SIZE)
+            self.buf.extend(data)
+            return bool(data)
+        while True:
+            if not self.pending:
+                self.pending = self.fh.read(CHUNK_SIZE)
+                if not self.pending:
+                    return False
+            data = self.inflate.decompress(self.pending)
+            self.pending = self.inflate.unused_data
+            if self.pending:
+                # the start of the next member
+                self.inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if data:
+                self.buf.extend(data)
+                return True
+
+    def read(self, size):
+        while len(self.buf) < size and self.fill():
+            pass
+        data = bytes(self.buf[:size])
+        del self.buf[:size]
+        return data
+
+    def readline(self):
+        pos = self.buf.find(b'\n')
+        while pos == -1 and self.fill():
+            pos = self.buf.find(b'\n')
+        if pos == -1:
+            pos = len(self.buf)
+        return self.read(pos + 1)
+
+
+def read_warc(fh):
+    """
+    Yield (url, html) pairs from the response and resource records of a WARC
+    file, gzipped or not, or (url, RecordError) for a record that cannot be
+    read. The HTTP headers of responses are skipped, after undoing a chunked
+    transfer encoding and a gzip or deflate content encoding. Pages are
+    decoded by the charset of their Content-Type header, if any; other pages
+    are left as bytes.
+    """
+    fh = WarcStream(fh)
+    # after a bad record, lines are skipped up to the next record
+    resync = False
+    while True:
+        line = fh.readline()
+        if not line:
+            return
+        if not line.strip():
+            continue
+        if not line.startswith(b'WARC/'):
+            if not resync:
+                resync = True
+                yield None, RecordError('not a WARC record: %r' % line[:40])
+            continue
+        resync = False
+        headers = read_headers(fh.readline)
+        url = headers.get(b'warc-target-uri')
+        if url is not None:
+            url = url.decode('utf-8', 'replace')
+        try:
+            size = int(headers[b'content-length'])
+        except (KeyError, ValueError) as exc:
+            resync = True
+            yield url, RecordError('bad record header: %s' % (describe(exc),))
+            continue
+        data = fh.read(size)
+        if len(data) < size:
+            yield url, RecordError('truncated record')
+            return
+        kind = headers.get(b'warc-type')
+        if kind not in (b'response', b'resource'):
+            continue
+        if kind == b'response' and data.startswith(b'HTTP/'):
+            try:
+                data, headers = read_http(data)
+            except (ValueError, zlib.error) as exc:
+                yield url, RecordError('bad HTTP response: %s' %
+                    (describe(exc),))
+                continue
+        match = RE_CHARSET.search(headers.get(b'content-type', b''))
+        if match:
+            try:
+                data = data.decode(match.group(1).decode('ascii'))
+            except (LookupError, UnicodeDecodeError):
+                pass
+        yield url, data
+
+
+def read_headers(readline):
+    "Read header lines from 'readline' up to a blank line into a dict."
+    headers = {}
+    while True:
+        line = readline()
+        if not line.strip():
+            return headers
+        key, _, val = line.partition(b':')
+        headers[key.strip().lower()] = val.strip()
+
+
+def read_http(data):
+    "Split the HTTP response 'data' into its decoded body and its headers."
+    head = io.BytesIO(data)
+    head.readline()
+    headers = read_headers(head.readline)
+    body = data[head.tell():]
+    if headers.get(b'transfer-encoding', b'').lower() == b'chunked':
+        body = dechunk(body)
+    encoding = headers.get(b'content-encoding', b'').lower()
+    if encoding in (b'gzip', b'x-gzip'):
+        body = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body)
+    elif encoding == b'deflate':
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            # raw deflate, as some servers send
+            body = zlib.decompressobj(-zlib.MAX_WBITS).decompress(body)
+    return body, headers
+
+
+def dechunk(data):
+    "Join the chunks of a body sent with a chunked transfer encoding."
+    parts = []
+    pos = 0
+    while True:
+        end = data.find(b'\n', pos)
+        if end == -1:
+            break
+        size = int(data[pos:end].split(b';', 1)[0].strip() or b'0', 16)
+        if not size:
+            break
+        parts.append(data[end + 1:end + 1 + size])
+        pos = end + 1 + size
+        # the line break after the chunk
+        while data[pos:pos + 1] in (b'\r', b'\n') and pos < len(data):
+            pos += 1
+    return b''.join(parts)
+
+
+READERS = {
+    'jsonl': read_jsonl,
+    'records': read_records,
+    'warc': read_warc,
+    }
+
+
+def read_inputs(paths, fmt, stdin):
+    "Yield (url, html) pairs from every file in 'paths', '-' being stdin."
+    reader = READERS[fmt]
+    for path in paths or ['-']:
+        if path == '-':
+            for rec in reader(stdin):
+                yield rec
+            continue
+        fh = open(path, 'rb')
+        try:
+            for rec in reader(fh):
+                yield rec
+        finally:
+            fh.close()
+
+
+class Stats(object):
+
+    "Throughput counters for a run."
+
+    def __init__(self):
+        self.start = time.time()
+        self.docs = 0
+        self.errors = 0
+        self.size = 0
+
+    def summary(self):
+        elapsed = max(time.time() - self.start, 1e-6)
+        return ('readable: %d documents, %d errors, %.1f MB in %.2fs '
+            '(%.1f docs/s, %.2f MB/s)\n' % (self.docs, self.errors,
+            self.size / 1e6, elapsed, self.docs / elapsed,
+            self.size / 1e6 / elapsed))
+
+
+def run(opts, stdin, stdout, stderr):
+    "Extract all input records described by 'opts'."
+    metrics = None
+    if opts.metrics:
+        metrics = Metrics()
+    cache = None
+    if opts.cache:
+        cache = TieredCache(MemoryCache(), SQLiteCache(opts.cache))
+    readable = Readable(debug=opts.debug, metrics=metrics, cache=cache)
+    stats = Stats()
+    # index and url of the records handed to the extractor, by the number
+    # extract_many gives them, until written out. extract_many reads ahead
+    # by a bounded amount, so this stays small.
+    records = {}
+    # (index, url, error) of the records that could not be read while
+    # records before them were being extracted, until written out after
+    # them.
+    bad = collections.deque()
+    numbers = itertools.count()
+
+    def write(rec):
+        if 'error' in rec:
+            stats.errors += 1
+        stats.docs += 1
+        stdout.write(json.dumps(rec) + '\n')
+        stdout.flush()
+
+    def documents():
+        for index, (url, data) in enumerate(read_inputs(opts.files,
+                opts.format, stdin)):
+            if isinstance(data, RecordError):
+                if records or bad:
+                    bad.append((index, url, str(data)))
+                else:
+                    write({'index': index, 'url': url, 'error': str(data)})
+                continue
+            records[next(numbers)] = index, url
+            stats.size += len(data)
+            yield data
+
+    results = readable.extract_many(documents(), workers=opts.workers,
+        chunksize=opts.chunksize, ordered=not opts.unordered,
+        output=opts.output)
+    for res in results:
+        index, url = records.pop(res.index)
+        while bad and bad[0][0] < index:
+            write(dict(zip(('index', 'url', 'error'), bad.popleft())))
+        rec = {'index': index, 'url': url}
+        if res.error is None:
+            rec['content'] = res.content
+            if opts.output == 'paragraphs':
+                rec['content'] = [dict(p._asdict()) for p in res.content]
+        else:
+            rec['error'] = res.error
+        write(rec)
+    while bad:
+        write(dict(zip(('index', 'url', 'error'), bad.popleft())))
+    if not opts.quiet:
+        stderr.write(stats.summary())
+    if metrics is not None:
+        write_metrics(metrics, opts.metrics)
+    return stats
+
+
+def write_metrics(metrics, path):
+    "Write 'metrics' to 'path', in a format chosen by its extension."
+    if path.endswith('.json'):
+        data = metrics.to_json(indent=2)
+    else:
+        data = metrics.to_prometheus()
+    fh = open(path, 'w')
+    try:
+        fh.write(data)
+    finally:
+        fh.close()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='readable',
+        description='Extract the readable content of a stream of HTML '
+            'documents as JSON lines.')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+        help="input files, '-' or none for stdin")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='jsonl',
+        help='input record format, WARC files may be gzipped '
+        '(default: jsonl)')
+    parser.add_argument('-o', '--output', choices=OUTPUTS,
+        default='html', help='extracted content format (default: html)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help='number of worker processes (default: 1)')
+    parser.add_argument('-c', '--chunksize', type=int, default=1,
+        help='documents sent to a worker at a time (default: 1)')
+    parser.add_argument('-u', '--unordered', action='store_true',
+        help='write results as they complete instead of in input order')
+    parser.add_argument('-q', '--quiet', action='store_true',
+        help='do not print a throughput summary')
+    parser.add_argument('-d', '--debug', action='store_true',
+        help='log extraction decisions to stderr')
+    parser.add_argument('--cache', metavar='FILE',
+        help='reuse the results stored in the SQLite database FILE')
+    parser.add_argument('-m', '--metrics', metavar='FILE',
+        help='write extraction metrics to FILE, as JSON if it ends in .json')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    run(opts, stdin, sys.stdout, sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
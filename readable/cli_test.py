@@ -0,0 +1,206 @@
+
+
+# std
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+# local
+from readable import cli
+from readable import core
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_data(name):
+    path = os.path.join(ROOT, 'testdata', name)
+    fh = open(path, 'rb')
+    data = fh.read()
+    fh.close()
+    return data
+
+
+class TestCli(unittest.TestCase):
+
+    def run_cli(self, argv, data):
+        # the standard streams take native strings
+        stdout = io.BytesIO() if str is bytes else io.StringIO()
+        stderr = io.BytesIO() if str is bytes else io.StringIO()
+        stats = cli.run(cli.parse_args(argv), io.BytesIO(data), stdout,
+            stderr)
+        lines = stdout.getvalue().splitlines()
+        return stats, [json.loads(l) for l in lines], stderr.getvalue()
+
+    def test_formats(self):
+        article = get_data('article.html')
+        exp = core.Readable().extract(article, 'text')
+        jsonl = ''.join(json.dumps({'url': 'http://x/%d' % i, 'html': h}) +
+            '\n' for i, h in enumerate([article.decode('utf-8'), '']))
+        jsonl = jsonl.encode('utf-8')
+        records = (b'%d http://x/0\n' % len(article) + article +
+            b'\n0 http://x/1\n')
+        body = b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n' + article
+        warc = b''.join([
+            b'WARC/1.0\r\nWARC-Type: warcinfo\r\nContent-Length: 3\r\n\r\n'
+            b'abc\r\n\r\n',
+            b'WARC/1.0\r\nWARC-Type: response\r\n'
+            b'WARC-Target-URI: http://x/0\r\n'
+            b'Content-Length: %d\r\n\r\n' % len(body), body, b'\r\n\r\n',
+            b'WARC/1.0\r\nWARC-Type: resource\r\n'
+            b'WARC-Target-URI: http://x/1\r\nContent-Length: 0\r\n\r\n'
+            b'\r\n\r\n',
+            ])
+        for fmt, data in (('jsonl', jsonl), ('records', records),
+                ('warc', warc)):
+            for workers in ('1', '2'):
+                stats, res, err = self.run_cli(['-f', fmt, '-o', 'text',
+                    '-w', workers], data)
+                self.assertEquals([r['url'] for r in res],
+                    ['http://x/0', 'http://x/1'])
+                self.assertEquals(res[0]['content'], exp)
+                self.assertTrue('Document is empty' in res[1]['error'])
+                self.assertEquals((stats.docs, stats.errors), (2, 1))
+                self.assertTrue(err.startswith('readable: 2 documents'))
+
+    def test_warc(self):
+        article = get_data('article.html')
+        exp = core.Readable().extract(article, 'text')
+        text = u'<html><body><p>\u041f\u0440\u0438\u0432\u0435\u0442, '
+        text = (text * 20 + u'</p></body></html>').encode('cp1251')
+
+        def gzip(data):
+            compress = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            return compress.compress(data) + compress.flush()
+
+        def record(url, headers, body):
+            http = b'HTTP/1.1 200 OK\r\n' + headers + b'\r\n' + body
+            return (b'WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: '
+                + url + b'\r\nContent-Length: %d\r\n\r\n' % len(http) +
+                http + b'\r\n\r\n')
+
+        packed = gzip(article)
+        chunked = b''.join(b'%x;ext=1\r\n%s\r\n' % (len(packed[i:i + 500]),
+            packed[i:i + 500]) for i in range(0, len(packed), 500)) + \
+            b'0\r\n\r\n'
+        records = [
+            record(b'http://x/0', b'Transfer-Encoding: chunked\r\n'
+                b'Content-Encoding: gzip\r\n', chunked),
+            record(b'http://x/1', b'Content-Type: text/html; '
+                b'charset=windows-1251\r\nContent-Encoding: deflate\r\n',
+                zlib.compress(text)),
+            ]
+        for warc in (b''.join(records), b''.join(gzip(r) for r in records)):
+            stats, res, err = self.run_cli(['-f', 'warc', '-o', 'text'], warc)
+            self.assertEquals([r['url'] for r in res],
+                ['http://x/0', 'http://x/1'])
+            self.assertEquals(res[0]['content'], exp)
+            self.assertTrue(res[1]['content'].startswith(
+                u'\u041f\u0440\u0438\u0432\u0435\u0442,'))
+
+        # a gzip member may end anywhere in a read
+        stream = cli.WarcStream(io.BytesIO(b''.join(gzip(r) for r in
+            records * 20)))
+        stream.pending, rest = stream.pending[:7], stream.pending[7:]
+        stream.fh = io.BytesIO(rest + stream.fh.read())
+        self.assertEquals(stream.read(10 ** 7), b''.join(records * 20))
+
+    def test_bad_records(self):
+        article = get_data('article.html')
+        exp = core.Readable().extract(article, 'text')
+        good = json.dumps({'url': 'http://x/0', 'html':
+            article.decode('utf-8')}).encode('utf-8') + b'\n'
+        jsonl = (b'not json\n' + good + b'{"url": "http://x/1"}\n[1]\n' +
+            good)
+        records = (b'x http://x/0\n<p>lost</p>\nmore\n' +
+            b'%d http://x/1\n' % len(article) + article +
+            b'\n%d http://x/2\n' % len(article) + article[:-10])
+        body = b'HTTP/1.1 200 OK\r\n\r\n' + article
+        response = (b'WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: '
+            b'http://x/1\r\nContent-Length: %d\r\n\r\n' % len(body) + body +
+            b'\r\n\r\n')
+        warc = (b'WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: '
+            b'http://x/0\r\n\r\n' + body + b'\r\n\r\n' + response +
+            b'garbage\r\n' + response)
+        for fmt, data, exp_errors in [
+                ('jsonl', jsonl, [0, 2, 3]),
+                ('records', records, [0, 2]),
+                ('warc', warc, [0, 2])]:
+            for workers in ('1', '2'):
+                stats, res, err = self.run_cli(['-f', fmt, '-o', 'text',
+                    '-w', workers], data)
+                self.assertEquals([r['index'] for r in res],
+                    list(range(len(res))))
+                self.assertEquals([r['index'] for r in res if 'error' in r],
+                    exp_errors)
+                for r in res:
+                    self.assertEquals(r.get('content', exp), exp)
+                self.assertEquals((stats.docs, stats.errors),
+                    (len(res), len(exp_errors)))
+                self.assertTrue(err.startswith('readable: %d documents, '
+                    '%d errors' % (len(res), len(exp_errors))))
+        stats, res, err = self.run_cli(['-f', 'records', '-q'], records)
+        self.assertTrue(res[0]['error'].startswith('bad record header: '))
+        self.assertEquals([r.get('error') for r in res[1:]],
+            [None, 'truncated record'])
+        self.assertEquals(res[2]['url'], 'http://x/2')
+
+    def test_paragraphs(self):
+        article = get_data('article.html')
+        data = b'%d\n' % len(article) + article
+        stats, res, err = self.run_cli(['-f', 'records', '-q', '-o',
+            'paragraphs'], data)
+        exp = core.Readable().extract(article, 'paragraphs')
+        self.assertEquals(res[0]['content'], [{'text': p.text,
+            'start': p.start, 'end': p.end, 'tag': p.tag} for p in exp])
+
+    def test_cache(self):
+        article = get_data('article.html')
+        data = b'%d\n' % len(article) + article
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'cache.db')
+            metrics = os.path.join(tmp, 'metrics.json')
+            runs = []
+            for i in range(2):
+                stats, res, err = self.run_cli(['-f', 'records', '-q',
+                    '--cache', path, '-m', metrics], data)
+                fh = open(metrics)
+                counters = json.load(fh)['counters']
+                fh.close()
+                runs.append((res[0]['content'], len(counters)))
+            self.assertEquals(runs[0][0], core.Readable().extract(article))
+            # the second run extracted nothing
+            self.assertEquals(runs[1], (runs[0][0], 0))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_metrics(self):
+        article = get_data('article.html')
+        data = b'%d\n' % len(article) + article
+        tmp = tempfile.mkdtemp()
+        try:
+            for name in ('metrics.prom', 'metrics.json'):
+                path = os.path.join(tmp, name)
+                self.run_cli(['-f', 'records', '-q', '-m', path], data)
+                fh = open(path)
+                out = fh.read()
+                fh.close()
+                if name.endswith('.json'):
+                    self.assertTrue(json.loads(out)['counters'])
+                else:
+                    self.assertTrue('readable_documents_total 1\n' in out)
+        finally:
+            shutil.rmtree(tmp)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -23,13 +23,41 @@ UPSTREAM_VERSION = '1.7.1'      # cloned 11/14/2010
 
 
 # std
+import codecs
+import collections
+import copy
+import hashlib
+import io
+import json
 import math
+import mmap
+import multiprocessing
+import os
+import pickle
 import re
+import stat
 import sys
+import threading
+import time
+import traceback
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+try:
+    from urllib.parse import unquote_plus, urljoin, urlsplit
+except ImportError:
+    from urllib import unquote_plus
+    from urlparse import urljoin, urlsplit
 
 # vendor
+import lxml.etree
 import lxml.html
-import lxml.html.clean
+import lxml.html.defs
 
 
 __pychecker__ = 'no-objattrs'
@@ -55,55 +83,180 @@ XPATH_REPL_PARAS = '|'.join([('.//%s' % t) for t in _REPL_PARAS])
 RE_SENT = re.compile('\.( |$)')
 RE_NORMALIZE = re.compile('\s{2,}')
 RE_VIDEOS = re.compile('http:\/\/(www\.)?(youtube|vimeo)\.com', re.I)
+INDEX_TAGS = ('p', 'img', 'li', 'input', 'embed', 'object')
+NON_ELEMENTS = (lxml.etree.Comment, lxml.etree.ProcessingInstruction,
+    lxml.etree.Entity)
+
+# document cleaning, see 'clean_document'
+KNOWN_TAGS = lxml.html.defs.tags
+KILL_TAGS = frozenset(['script', 'link', lxml.etree.Comment,
+    lxml.etree.ProcessingInstruction])
+LINK_ATTRS = lxml.html.defs.link_attrs
+# tags with links outside their plain link attributes
+LINK_TAGS = frozenset(['object', 'meta', 'param', 'style'])
+RE_CSS_JAVASCRIPT = re.compile(r'expression\s*\(.*?\)', re.S | re.I)
+RE_CSS_IMPORT = re.compile(r'@\s*import', re.I)
+# the checks of 'is_javascript_link' and 'has_sneaky_javascript'
+RE_IMAGE_DATAURL = re.compile(r'data:image/(.+);base64,', re.I)
+RE_UNSAFE_IMAGE = re.compile(r'(xml|svg)', re.I)
+RE_SCRIPT_SCHEME = re.compile(
+    r'(javascript|jscript|livescript|vbscript|data|about|mocha):', re.I)
+RE_LINK_SPACE = re.compile(r'[\s\x00-\x08\x0B\x0C\x0E-\x19]+')
+RE_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+RE_TAG_CONTENT = re.compile(r'</?[a-zA-Z]+|[ \t\n\r\f\v]on[a-zA-Z]+'
+    r'[ \t\n\r\f\v]*=')
+
+# title, direction and metadata, see 'get_metadata'
+RE_TITLE_SEP = re.compile(r' [\|\-] ')
+RE_TITLE_HEAD = re.compile(r'(.*)[\|\-] .*')
+RE_TITLE_TAIL = re.compile(r'[^\|\-]*[\|\-](.*)')
+RE_TITLE_COLON_HEAD = re.compile(r'.*:(.*)')
+RE_TITLE_COLON_TAIL = re.compile(r'[^:]*[:](.*)')
+RE_HANDLE = re.compile(r'@\w+', re.U)
+RE_RTL = re.compile(u'[\u05B0-\u05F4\uFB1D-\uFBF4\u060C-\u06FE\uFB50-\uFEFC]')
+# names of the <meta> tags holding each field, the first one found wins
+META_FIELDS = (
+    ('canonical', ('og:url',)),
+    ('description', ('description', 'og:description', 'twitter:description',
+        'dc.description')),
+    ('published', ('article:published_time', 'datepublished',
+        'og:published_time', 'dc.date.issued', 'dcterms.created', 'dc.date',
+        'pubdate', 'publishdate', 'date')),
+    )
+
+# next page links, see 'find_next_page_link'
+RE_EXTRANEOUS = re.compile('print|archive|comment|discuss|e-?mail|share|'
+    'reply|all|login|sign|single', re.I)
+# next, continue, > and >> or \xbb, but not >| or \xbb| which mean last
+RE_NEXT_LINK = re.compile(u'(next|weiter|continue|>([^|]|$)|\xbb([^|]|$))',
+    re.I | re.U)
+RE_PREV_LINK = re.compile(u'(prev|earl|old|new|<|\xab)', re.I | re.U)
+RE_FIRST_LAST = re.compile('(first|last)', re.I)
+RE_PAGING = re.compile('pag(e|ing|inat)', re.I)
+RE_PAGE_URL = re.compile('p(a|g|ag)?(e|ing|ination)?(=|/)[0-9]{1,2}', re.I)
+RE_PAGE_WORD = re.compile('(page|paging)', re.I)
+RE_PAGE_SEGMENT = re.compile('((_|-)?p[a-z]*|(_|-))[0-9]{1,2}$', re.I)
+RE_PAGE_NUMBER = re.compile(r'\s*([-+]?\d+)')
+
+# input, see 'open_input' and 'parse'
+TEXT = type(u'')
+# raw streams of a real file, the only ones memory-mapped
+try:
+    FILE_TYPES = (io.FileIO, file)
+except NameError:
+    FILE_TYPES = (io.FileIO,)
+# bytes searched for a declared charset, and fed to the parser at a time
+SNIFF_SIZE = 1024
+CHUNK_SIZE = 64 * 1024
+BOMS = ((codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'))
+RE_CHARSET = re.compile(br'<meta[^>]*?charset\s*=\s*["\']?\s*([-\w.:]+)|'
+    br'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([-\w.:]+)', re.I)
+# what 'lxml.html.fromstring' parses as a whole document
+RE_FULL_HTML = re.compile(br'\s*<(?:html|!doctype)', re.I)
+
+# content serialization, see 'serialize'
+OUTPUTS = ('html', 'text', 'paragraphs')
+# tags starting a new paragraph in 'paragraphs' output
+BLOCK_TAGS = lxml.html.defs.block_tags | frozenset(['article', 'aside',
+    'figcaption', 'figure', 'footer', 'header', 'main', 'nav', 'section'])
+
+
+# The link and style checks below are those of 'lxml.html.clean' (lxml 5.1,
+# Cleaner._remove_javascript_link and Cleaner._has_sneaky_javascript), which
+# are private there; lxml 5.2 moved the module out to 'lxml_html_clean'.
+
+def has_script_scheme(value):
+    "Whether 'value' holds a scheme that can run script, see lxml.html.clean."
+    safe_images = 0
+    for image_type in RE_IMAGE_DATAURL.findall(value):
+        # SVG images can hold script
+        if RE_UNSAFE_IMAGE.search(image_type):
+            return True
+        safe_images += 1
+    return len(RE_SCRIPT_SCHEME.findall(value)) > safe_images
+
+
+def is_javascript_link(link):
+    """
+    Whether the link 'link' runs script, spaces and control characters
+    being ignored, as some browsers interpret "j a v a s c r i p t:".
+    """
+    return has_script_scheme(RE_LINK_SPACE.sub('', unquote_plus(link)))
 
 
-class Bag(object):
-
-    "Generic sticky object."
-
-    def __init__(self, **kwargs):
-        for key, val in kwargs.items():
-            setattr(self, key, val)
-
-    def __setattr__(self, key, val):
-        self.__dict__[key] = val
-
-    def __str__(self):
-        r = ' '.join('%s=%s' % (k, repr(v)) for k, v in self.__dict__.items())
-        return '<Bag ' + r + '>'
+def has_sneaky_javascript(style):
+    """
+    Whether the CSS 'style' holds script hidden by comments, escapes or
+    spaces, such as "e x p r e s s i o n(...)", or markup.
+    """
+    style = RE_CSS_COMMENT.sub('', style).replace('\\', '')
+    style = RE_LINK_SPACE.sub('', style).lower()
+    return has_script_scheme(style) or 'expression(' in style or \
+        '@import' in style or '</noscript' in style or \
+        bool(RE_TAG_CONTENT.search(style))
 
 
 class NodeIter(object):
 
-    "Mimic the behavior of browser's 'node list' iterator / array."
+    """
+    Mimic the behavior of browser's 'node list' iterator / array.
+
+    Instead of snapshotting the descendants of 'root', the iterator keeps a
+    cursor into the live tree and finds the next node in document order on
+    demand, so removing the current node only moves the cursor.
+    """
 
     def __init__(self, root):
         self.root = root
-        self.nodes = list(root.iterdescendants())
         self.idx = 0
         self.current = None
+        # the next node is either given explicitly, or is the first node
+        # following 'after' in document order, descendants included.
+        self.following = None
+        self.after = root
 
     def __iter__(self):
         return self
 
-    def size(self):
-        return len(self.nodes)
-
-    def backup(self):
-        self.idx -= 1
-
     def next(self):
-        if self.idx >= len(self.nodes):
+        node = self.following
+        if node is None and self.after is not None:
+            node = self.after
+            if len(node):
+                node = node[0]
+            else:
+                node = self.skip(node)
+        if node is None:
+            self.after = None
             raise StopIteration()
-        node = self.nodes[self.idx]
         self.current = node
+        self.following = None
+        self.after = node
         idx = self.idx
         self.idx += 1
         return idx, node
 
-    def refresh(self):
-        "Keep pointer in same place but rebuild descendants list."
-        self.nodes = list(self.root.iterdescendants())
+    __next__ = next
+
+    def skip(self, node):
+        "Return the node after 'node' in document order, skipping its subtree."
+        root = self.root
+        while node is not root:
+            sib = node.getnext()
+            if sib is not None:
+                return sib
+            node = node.getparent()
+        return None
+
+    def revisit(self):
+        """
+        Visit the current node again. As with the browser's live nodelist,
+        a node replaced in place is visited as the node replacing it.
+        """
+        self.following = self.current
+        self.after = None
+        self.idx -= 1
 
     def remove(self):
         """
@@ -114,15 +267,414 @@ class NodeIter(object):
         curr = self.current
         if curr is None:
             return
+        self.following = self.skip(curr)
+        self.after = None
         curr.getparent().remove(curr)
-        self.nodes = list(self.root.iterdescendants())
         self.idx -= 1
 
 
+class NodeIndex(object):
+
+    """
+    Per-extraction index of statistics for the subtree of each node: the
+    length of its normalized inner text, the length of the text inside its
+    links, the number of commas, and how many descendants carry each of the
+    tags in INDEX_TAGS. Statistics are computed bottom up and cached, so each
+    node and piece of text is looked at once. Removing a node through
+    'remove' only drops the cached totals of its ancestors, which are then
+    recombined from their children.
+    """
+
+    # text summary of a text with no characters at all
+    EMPTY = (None, '', '', 0, 0)
+
+    # tag counts are kept in this order, followed by the number of embeds
+    # linking to a video site.
+    SLOTS = dict((tag, i) for i, tag in enumerate(INDEX_TAGS))
+    VIDEO_SLOT = len(INDEX_TAGS)
+    NO_TAGS = (0,) * (len(INDEX_TAGS) + 1)
+
+    def __init__(self):
+        self.stats = {}
+
+    def get(self, node):
+        "Return the statistics record for 'node', computing it if needed."
+        stats = self.stats
+        rec = stats.get(node)
+        if rec is not None:
+            return rec
+        # post-order walk, skipping subtrees that are already indexed
+        todo = [(node, 0)]
+        while todo:
+            n, ready = todo.pop()
+            if ready:
+                stats[n] = self.compute(n)
+                continue
+            todo.append((n, 1))
+            for c in n:
+                if c not in stats:
+                    todo.append((c, 0))
+        return stats[node]
+
+    def compute(self, node):
+        """
+        Combine the records of the children of 'node' with its own text and
+        the children's tails, following the order used by text_content().
+        Records are tuples (length, head, tail, links, commas, tags).
+        'length' is the length of the normalized, stripped text or None if
+        it is all whitespace, and 'head' and 'tail' hold the normalized
+        whitespace around it, needed to join with neighbouring text. 'tags'
+        holds the descendant tag counts.
+        """
+        if node.tag in NON_ELEMENTS:
+            return self.EMPTY + (self.NO_TAGS,)
+        stats = self.stats
+        slots = self.SLOTS
+        rec = self.summarize(node.text)
+        links = 0
+        tags = self.NO_TAGS
+        for c in node:
+            crec = stats[c]
+            rec = self.join(rec, crec)
+            ctag = c.tag
+            if ctag == 'a':
+                links += crec[0] or 0
+            links += crec[3]
+            ctags = crec[5]
+            slot = slots.get(ctag)
+            if ctags is not self.NO_TAGS or slot is not None:
+                tags = [a + b for a, b in zip(tags, ctags)]
+                if slot is not None:
+                    tags[slot] += 1
+                    if ctag == 'embed' and RE_VIDEOS.search(c.get('src', '')):
+                        tags[self.VIDEO_SLOT] += 1
+                tags = tuple(tags)
+            if c.tail:
+                rec = self.join(rec, self.summarize(c.tail))
+        return (rec[0], rec[1], rec[2], links, rec[4], tags)
+
+    def summarize(self, text):
+        "Return a text summary for a single piece of text."
+        if not text:
+            return self.EMPTY
+        commas = text.count(',')
+        core = text.strip()
+        if not core:
+            ws = RE_NORMALIZE.sub(' ', text)
+            return (None, ws, ws, 0, commas)
+        head = text[:len(text) - len(text.lstrip())]
+        tail = text[len(text.rstrip()):]
+        return (len(RE_NORMALIZE.sub(' ', core)), RE_NORMALIZE.sub(' ', head),
+            RE_NORMALIZE.sub(' ', tail), 0, commas)
+
+    def join(self, a, b):
+        "Return the text summary of the text of 'a' followed by that of 'b'."
+        alen = a[0]
+        blen = b[0]
+        commas = a[4] + b[4]
+        ws = a[2] + b[1]
+        if len(ws) > 1:
+            ws = RE_NORMALIZE.sub(' ', ws)
+        if alen is None:
+            if blen is None:
+                return (None, ws, ws, 0, commas)
+            return (blen, ws, b[2], 0, commas)
+        if blen is None:
+            return (alen, a[1], ws, 0, commas)
+        return (alen + len(ws) + blen, a[1], b[2], 0, commas)
+
+    def text_length(self, node):
+        "Return the length of the normalized inner text of 'node'."
+        return self.get(node)[0] or 0
+
+    def has_text(self, node):
+        "Return whether 'node' contains any non-whitespace text."
+        return self.get(node)[0] is not None
+
+    def link_length(self, node):
+        "Return the total inner text length of links below 'node'."
+        return self.get(node)[3]
+
+    def comma_count(self, node):
+        "Return the number of commas in the inner text of 'node'."
+        return self.get(node)[4]
+
+    def tag_count(self, node, tag):
+        "Return the number of descendants of 'node' with the given 'tag'."
+        slot = self.SLOTS.get(tag)
+        if slot is None:
+            return len(node.xpath('.//%s' % tag))
+        return self.get(node)[5][slot]
+
+    def video_count(self, node):
+        "Return the number of embeds below 'node' linking to a video site."
+        return self.get(node)[5][self.VIDEO_SLOT]
+
+    def invalidate(self, node):
+        "Drop the cached totals of 'node' and its ancestors."
+        stats = self.stats
+        while node is not None and node in stats:
+            del stats[node]
+            node = node.getparent()
+
+    def remove(self, node):
+        "Remove 'node' from its parent, keeping the index up to date."
+        parent = node.getparent()
+        self.invalidate(parent)
+        parent.remove(node)
+
+
+class ScoredTree(object):
+
+    """
+    A tree selected for scoring, with its node index and the features the
+    scores of its candidates are computed from, none of which depend on the
+    extraction flags, so a pass under other flags only redoes the
+    arithmetic. The features of the scored paragraphs are lists, in
+    document order:
+
+      lengths   the text length of the paragraph
+      commas    its number of commas
+      parents   the position of its parent in 'candidates'
+      gparents  the position of its grandparent, or -1 if it has none
+
+    Those of the candidates are lists aligned with 'candidates':
+
+      base      the score of the candidate's tag
+      weight    its class weight, counted under FLAG_CLASS_WEIGHT
+      density   its link density
+
+    'content', the sum of the scores of the paragraphs below each
+    candidate, is filled in by 'Readable.apply_scores' on first use.
+    """
+
+    PARAGRAPHS = ('lengths', 'commas', 'parents', 'gparents')
+    COLUMNS = ('base', 'weight', 'density')
+
+    def __init__(self, body, index):
+        self.body = body
+        self.index = index
+        self.candidates = []
+        for name in self.PARAGRAPHS + self.COLUMNS:
+            setattr(self, name, [])
+        self.content = None
+
+
+class Classifier(object):
+
+    """
+    Verdicts of the class and id patterns on attribute values, cached in a
+    bounded LRU keyed by the whole value: the patterns match substrings, such
+    as 'com-' or 'ad-break', so values are not split into tokens. Pages
+    repeat a small set of values, and the cache is shared by all extractions
+    in a process, so it is thread safe.
+    """
+
+    EMPTY = (False, 0)
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def classify(self, value):
+        """
+        Return a tuple (unlikely, weight) for the attribute value 'value':
+        whether it marks an unlikely candidate, and its class weight.
+        """
+        if not value:
+            return self.EMPTY
+        cache = self.cache
+        with self.lock:
+            verdict = cache.pop(value, None)
+            if verdict is not None:
+                cache[value] = verdict
+                self.hits += 1
+                return verdict
+        weight = 0
+        if RE_NEGATIVE.search(value):
+            weight -= 25
+        if RE_POSITIVE.search(value):
+            weight += 25
+        unlikely = bool(RE_UNLIKELY.search(value)) and \
+            not RE_MAYBE.search(value)
+        verdict = (unlikely, weight)
+        with self.lock:
+            self.misses += 1
+            cache[value] = verdict
+            if len(cache) > self.size:
+                cache.popitem(last=False)
+        return verdict
+
+    def clear(self):
+        "Empty the cache and reset its counters."
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# classifier shared by all Readable instances
+CLASSIFIER = Classifier()
+
+
+class Result(collections.namedtuple('Result', 'index content error')):
+
+    """
+    The outcome of extracting one document in 'Readable.extract_many'.
+    'index' is the position of the document in the input, 'content' the
+    serialized extracted content, and 'error' the formatted traceback if
+    extraction failed, in which case 'content' is None.
+    """
+
+    __slots__ = ()
+
+
+class Paragraph(collections.namedtuple('Paragraph', 'text start end tag')):
+
+    """
+    A paragraph of extracted content, as returned by 'Readable.serialize'
+    for the 'paragraphs' output: its normalized 'text', found at
+    [start:end] in the 'text' output of the same content, and the 'tag' of
+    the block element holding it.
+    """
+
+    __slots__ = ()
+
+
+class Article(collections.namedtuple('Article',
+        'content title direction canonical description published budgets')):
+
+    """
+    The readable content of a page along with its metadata, as returned by
+    'Readable.grab' and 'Readable.extract_article'. 'title' is the title of
+    the page as readability finds it, 'direction' the suggested direction
+    of its text, 'ltr' or 'rtl', and 'canonical', 'description' and
+    'published' are the canonical url, description and publication date
+    declared in the head of the page, as written, or None. 'budgets' names
+    the limits of the Budget that cut the extraction short, if any:
+    'bytes', 'nodes', 'passes' or 'seconds'.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, content, title=None, direction='ltr', canonical=None,
+            description=None, published=None, budgets=()):
+        return super(Article, cls).__new__(cls, content, title, direction,
+            canonical, description, published, tuple(budgets))
+
+
+class Budget(collections.namedtuple('Budget',
+        'max_bytes max_nodes max_seconds max_passes')):
+
+    """
+    Limits on the work 'Readable.grab_article' does on a document, each
+    None for no limit. Input beyond 'max_bytes' (characters, for unicode
+    input) is not parsed, and nodes
+    beyond the first 'max_nodes' of the prepared document are dropped, which
+    bounds the time of a pass. No pass is started after 'max_passes' passes;
+    the content of the pass that found the most text is returned instead,
+    or the whole body when no pass ran. 'max_seconds' is also checked once
+    the document is prepped and while a pass selects and cleans its content:
+    the pass is cut short, and the content it was cleaning, the content of
+    the best pass before it or, on the first pass, the whole body is
+    returned. The budgets that ran out are listed in the 'budgets' of the
+    Article and reported to the metrics sink.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, max_bytes=None, max_nodes=None, max_seconds=None,
+            max_passes=None):
+        return super(Budget, cls).__new__(cls, max_bytes, max_nodes,
+            max_seconds, max_passes)
+
+    def exhausted(self, passes, seconds):
+        """
+        Return the name of the budget leaving no room for another pass after
+        'passes' passes and 'seconds' seconds, or None.
+        """
+        if self.max_passes is not None and passes >= self.max_passes:
+            return 'passes'
+        if self.max_seconds is not None and seconds >= self.max_seconds:
+            return 'seconds'
+        return None
+
+
+class OutOfTime(Exception):
+
+    """
+    Raised within an extraction pass when its time budget ran out, with the
+    'content' it was working on, if any.
+    """
+
+    def __init__(self, content=None):
+        Exception.__init__(self)
+        self.content = content
+
+
+def resolve_canonical(article, url):
+    "Return 'article' with its canonical url resolved against 'url', if any."
+    if url is None or article.canonical is None:
+        return article
+    return article._replace(canonical=urljoin(url, article.canonical))
+
+
+def _release_nothing():
+    "Release an input of 'Readable.open_input' that holds no resources."
+
+
+# readable instance and output mode of an 'extract_many' worker process
+_worker = None
+
+
+def _init_worker(readable, output):
+    global _worker
+    # start from empty metrics, what the parent collected stays there
+    if hasattr(readable.metrics, 'drain'):
+        readable.metrics.drain()
+    _worker = (readable, output)
+
+
+def _extract_chunk(args):
+    """
+    Extract a numbered chunk of documents in a worker process, returning the
+    metrics collected meanwhile for the parent process to merge.
+    """
+    readable, output = _worker
+    num, chunk = args
+    results = readable.extract_chunk(chunk, output)
+    metrics = None
+    if hasattr(readable.metrics, 'drain'):
+        metrics = readable.metrics.drain()
+    return num, results, metrics, None
+
+
+def _extract_pickled(num, payload):
+    """
+    Extract the chunk pickled in 'payload' as '_extract_chunk' does, for
+    pools without error callbacks: an error is returned, not raised.
+    """
+    try:
+        return _extract_chunk(pickle.loads(payload))
+    except Exception:
+        return num, None, None, traceback.format_exc()
+
+
 class Readable(object):
 
     """
     Implementation of readability's content extraction rules.
+
+    'metrics' is an optional sink for extraction metrics, such as
+    'readable.metrics.Metrics'; see that module for the methods it is called
+    with. 'cache' is an optional store of the results of 'extract', such as
+    'readable.cache.TieredCache'; see that module. 'profiles' is an optional
+    store of where the content of each site was found, such as
+    'readable.profiles.SiteProfiles', used for pages extracted with a url.
+    'budget' is an optional Budget limiting the work done per document.
     """
 
     FLAG_NONE = 0x0
@@ -137,16 +689,81 @@ class Readable(object):
         FLAG_CLEAN_CONDITIONALLY
         ]
 
-    def __init__(self, debug=0):
+    classifier = CLASSIFIER
+
+    # methods timed when a metrics sink is attached
+    STAGES = ('prep_document', 'copy_document', 'copy_scored',
+        'select_scorable', 'score_nodes', 'score_paras', 'prep_article')
+
+    def __init__(self, debug=0, metrics=None, cache=None, profiles=None,
+            budget=None):
         self.debug = debug
+        self.metrics = metrics
+        self.cache = cache
+        self.profiles = profiles
+        self.budget = budget
         self.flags = 0xFFFF
+        self.messages = []
+        # counters of the current pass, only kept when metrics are collected
+        self.trace = None
+        # when the time budget of the current extraction runs out
+        self.deadline = None
+        self.reset()
+
+    def context(self):
+        """
+        Return a copy of this instance to hold the state of a single call:
+        flags, node index, score table and log messages. The configured
+        instance itself is never modified by an extraction, so it can be
+        reused across documents and shared between threads.
+        """
+        ctx = copy.copy(self)
+        ctx.messages = []
+        ctx.reset()
+        if ctx.metrics is not None:
+            for stage in ctx.STAGES:
+                setattr(ctx, stage, ctx._timed(stage, getattr(ctx, stage)))
+        return ctx
+
+    def _timed(self, stage, func):
+        "Wrap 'func' to report its run time as 'stage' to the metrics sink."
+        metrics = self.metrics
+
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.stage(stage, time.time() - start)
+        return timed
+
+    def reset(self):
+        "Drop the node index and score table of the previous extraction."
+        self.index = NodeIndex()
+        self.scores = {}
+        # the top candidate selected, and its signature path for profiles
+        self.top = None
+        self.top_path = None
 
     def log(self, msg):
-        "Mimic use of console.log"
+        "Mimic use of console.log, buffering messages until 'flush_log'."
         if not self.debug:
             return
-        sys.stderr.write("Readable: " + msg + '\n')
+        self.messages.append("Readable: " + msg + '\n')
+
+    def flush_log(self):
+        "Write out buffered log messages in one go."
+        if not self.messages:
+            return
+        sys.stderr.write(''.join(self.messages))
         sys.stderr.flush()
+        self.messages = []
+
+    def remove_node(self, node):
+        "Remove 'node' while cleaning the extracted content."
+        if self.trace is not None:
+            self.trace['removed'] += 1
+        self.index.remove(node)
 
     def is_unlikely(self, node):
         "Return whether 'node' is unlikely and should be removed."
@@ -155,13 +772,13 @@ class Readable(object):
         if node.tag == 'body':
             return 0
         ms = ''.join(self.get_clsid(node))
-        if RE_UNLIKELY.search(ms) and not RE_MAYBE.search(ms):
+        if self.classifier.classify(ms)[0]:
             return 1
         return 0
 
     def is_readable(self, node):
         "Returns a boolean indicating that 'node' has been marked"
-        return hasattr(node, 'readable')
+        return node in self.scores
 
     def get_clsid(self, node):
         "Return a tuple of the 'class' and 'id' attributes for 'node'."
@@ -172,14 +789,60 @@ class Readable(object):
         ncls, nid = self.get_clsid(node)
         return '%s (%s:%s)' % (node.tag, ncls, nid)
 
+    def get_signature_path(self, node):
+        """
+        Return the path from the body to 'node' as a tuple of (tag, class,
+        id, nth) for each node on the way, 'nth' counting the preceding
+        siblings with the same class and id. Unlikely candidates and <div>
+        tags changed to <p> during extraction do not change the count.
+        """
+        path = []
+        parent = node.getparent()
+        while parent is not None and node.tag != 'body':
+            clsid = self.get_clsid(node)
+            nth = 0
+            for n in node.itersiblings(preceding=True):
+                if self.get_clsid(n) == clsid:
+                    nth += 1
+            path.append((node.tag,) + clsid + (nth,))
+            node = parent
+            parent = node.getparent()
+        path.reverse()
+        return tuple(path)
+
+    def find_signature_path(self, root, path):
+        "Return the node at the signature 'path' from 'root', or None."
+        node = root
+        for tag, ncls, nid, nth in path:
+            for n in node.iterchildren():
+                if self.get_clsid(n) == (ncls, nid):
+                    if not nth:
+                        break
+                    nth -= 1
+            else:
+                return None
+            if n.tag != tag:
+                return None
+            node = n
+        return node
+
     def get_path(self, node):
         "Return a string representing the path to 'node' in the tree."
-        if node is None or node.tag == 'html':
-            return 'html'
-        return self.get_path(node.getparent()) + ' / ' + self.get_info(node)
+        path = []
+        while node is not None and node.tag != 'html':
+            path.append(self.get_info(node))
+            node = node.getparent()
+        path.append('html')
+        path.reverse()
+        return ' / '.join(path)
 
     def make_cleaner(self):
-        "Construct an object to clean out unwanted stuff from a node."
+        """
+        Construct an object to clean out unwanted stuff from a node, as
+        'clean_document' does without one.
+        """
+        # not needed otherwise, and a separate package from lxml 5.2 on
+        import lxml.html.clean
         opts = dict(scripts=True, javascript=True, comments=True,
             style=False, links=True, meta=False, page_structure=False, 
             processing_instructions=True, embedded=False, frames=False, 
@@ -188,13 +851,22 @@ class Readable(object):
 
     def node_copy(self, node):
         "Make a copy of a node, copying its attributes and children."
-        newn = lxml.html.Element(node.tag, node.attrib)
-        newn.text = node.text
-        newn.tail = node.tail
-        for c in node.getchildren():
-            newc = self.node_copy(c)
-            newn.append(newc)
-        return newn
+        root = None
+        # nodes to copy, with the copy of their parent
+        todo = [(node, None)]
+        while todo:
+            n, parent = todo.pop()
+            newn = lxml.html.Element(n.tag, n.attrib)
+            newn.text = n.text
+            newn.tail = n.tail
+            if parent is None:
+                root = newn
+            else:
+                parent.append(newn)
+            children = n.getchildren()
+            children.reverse()
+            todo.extend((c, newn) for c in children)
+        return root
 
 
     # line 185
@@ -210,10 +882,86 @@ class Readable(object):
     # getArticleTools
 
     # line 274
-    # getSuggestedDirection  - handles hebrew, right-to-left langs.
+    def get_suggested_direction(self, text):
+        """
+        Return 'rtl' when a fifth of 'text' is Hebrew or Arabic, otherwise
+        'ltr'. The first handle is dropped before the share is taken.
+        """
+        text = RE_HANDLE.sub('', text or u'', 1)
+        if not text:
+            return 'ltr'
+        count = len(RE_RTL.findall(text))
+        if count * 100.0 / len(text) > 20:
+            return 'rtl'
+        return 'ltr'
+
 
     # line 301
-    # getArticleTitle 
+    def get_article_title(self, root):
+        """
+        Return the title of the document 'root', without the name of the
+        site around it, or its only <h1> when the <title> is too short or
+        too long to be the title.
+        """
+        title = None
+        head = root if root.tag == 'head' else root.find('head')
+        if head is not None:
+            title = head.find('title')
+        cur_title = orig_title = u''
+        if title is not None:
+            cur_title = orig_title = u' '.join(title.text_content().split())
+
+        if RE_TITLE_SEP.search(cur_title):
+            cur_title = RE_TITLE_HEAD.sub(r'\1', orig_title)
+            if len(cur_title.split(' ')) < 3:
+                cur_title = RE_TITLE_TAIL.sub(r'\1', orig_title)
+        elif ': ' in cur_title:
+            cur_title = RE_TITLE_COLON_HEAD.sub(r'\1', orig_title)
+            if len(cur_title.split(' ')) < 3:
+                cur_title = RE_TITLE_COLON_TAIL.sub(r'\1', orig_title)
+        elif len(cur_title) > 150 or len(cur_title) < 15:
+            h_ones = root.findall('.//h1')
+            if len(h_ones) == 1:
+                cur_title = self.get_inner_text(h_ones[0])
+
+        cur_title = cur_title.strip()
+        if len(cur_title.split(' ')) <= 4:
+            cur_title = orig_title
+        return cur_title
+
+
+    # extracted from 'prep_document'
+    def get_metadata(self, root):
+        """
+        Return a dict of the 'title' and suggested text 'direction' of the
+        document 'root', and of the 'canonical' url, 'description' and
+        'published' date declared in its head, each None when missing.
+        """
+        title = self.get_article_title(root)
+        meta = {'title': title,
+            'direction': self.get_suggested_direction(title)}
+        head = root if root.tag == 'head' else root.find('head')
+        found = {}
+        canonical = None
+        if head is not None:
+            for n in head.iter('meta', 'link'):
+                if n.tag == 'link':
+                    rel = n.get('rel', '').lower().split()
+                    if canonical is None and 'canonical' in rel:
+                        canonical = n.get('href', '').strip() or None
+                    continue
+                name = n.get('name') or n.get('property') or \
+                    n.get('itemprop')
+                value = n.get('content', '').strip()
+                if name and value:
+                    found.setdefault(name.strip().lower(), value)
+        for field, names in META_FIELDS:
+            meta[field] = next((found[name] for name in names
+                if name in found), None)
+        if canonical is not None:
+            meta['canonical'] = canonical
+        return meta
+
 
     # line 353
     # getArticleFooter
@@ -222,12 +970,15 @@ class Readable(object):
     # line 375
     def prep_document(self, data):
         "Prep the document for extraction"
-        tree = lxml.html.fromstring(data)
-        # clean unknown tags out
-        cleaner = self.make_cleaner()
-        cleaner(tree)
+        tree = self.parse(data)
+        # the head is dropped below
+        self.metadata = self.get_metadata(tree)
+        self.clean_root(tree)
         body = tree.find('body')
         if body is None:
+            # clean the top level first, text left behind by removed nodes
+            # stays outside the new body
+            self.clean_children(tree)
             body = lxml.html.Element('body')
             for n in tree.getchildren():
                 body.append(n)
@@ -239,48 +990,292 @@ class Readable(object):
             if n.tag != 'body':
                 n.getparent().remove(n)
 
-        return self.convert_brs(body)
+        return self.clean_document(body)
 
 
-    def convert_brs(self, node, depth=0):
-        "Convert all text that is siblings of <br> tags to <p>"
-        # TODO: i prefer doing dom-based replacement of brs to using
-        # regexps, but this needs to be simplified.
-        children = node.getchildren()
-        has_br = 'br' in [n.tag for n in children]
-        if has_br:
-            newn = lxml.html.Element(node.tag, node.attrib)
-            if node.text and node.text.strip():
-                c = lxml.html.Element('p')
-                c.text = node.text
-                node.text = ''
-                newn.append(c)
+    # extracted from 'prep_document'
+    def parse(self, data):
+        """
+        Parse 'data' as 'lxml.html.fromstring' does. Unicode is parsed as it
+        is. The charset of bytes, or of a buffer such as mmap, is sniffed
+        once by 'sniff_encoding' and given to the parser, and a whole
+        document is fed to the parser in chunks rather than copied.
+        """
+        if isinstance(data, TEXT):
+            return lxml.html.fromstring(data)
+        head = bytes(data[:SNIFF_SIZE])
+        encoding, skip = self.sniff_encoding(head)
+        if encoding is not None and encoding.startswith('utf-16'):
+            # not ASCII compatible, the markup is looked at as unicode
+            return lxml.html.fromstring(bytes(data[skip:]).decode(encoding))
+        try:
+            parser = lxml.html.HTMLParser(encoding=encoding)
+        except LookupError:
+            # known to Python, but not to libxml2
+            parser = lxml.html.HTMLParser()
+        if not RE_FULL_HTML.match(head, skip):
+            # the fragment is looked at as a whole
+            return lxml.html.fromstring(bytes(data[skip:]), parser=parser)
+        if isinstance(data, bytes) and not skip:
+            return lxml.html.document_fromstring(data, parser)
+        for start in range(skip, len(data), CHUNK_SIZE):
+            parser.feed(bytes(data[start:start + CHUNK_SIZE]))
+        root = parser.close()
+        if root is None:
+            raise lxml.etree.ParserError('Document is empty')
+        return root
+
+
+    def sniff_encoding(self, head):
+        """
+        Return the charset declared at the start of a document, 'head', by
+        a byte order mark, a <meta> tag or an XML declaration, or None to
+        leave it to the parser, along with the length of the byte order
+        mark.
+        """
+        for bom, name in BOMS:
+            if head.startswith(bom):
+                return name, len(bom)
+        match = RE_CHARSET.search(head)
+        if match is None:
+            return None, 0
+        name = (match.group(1) or match.group(2)).decode('ascii')
+        try:
+            codec = codecs.lookup(name).name
+        except LookupError:
+            return None, 0
+        # a tag read as ASCII cannot be in a 16 or 32 bit charset
+        if codec.startswith(('utf-16', 'utf-32')):
+            return 'utf-8', 0
+        return name, 0
+
+
+    def open_input(self, data):
+        """
+        Return 'data' in a form 'parse' can read as many times as needed,
+        along with a function releasing it. Unicode, bytes and buffers such
+        as mmap are returned as they are. A path, as an os.PathLike object,
+        is opened and memory-mapped, as is a binary file object reading a
+        regular file from its start. Other file objects are read.
+        """
+        if isinstance(data, (TEXT, bytes, mmap.mmap)) or not (
+                hasattr(data, 'read') or hasattr(data, '__fspath__')):
+            return data, _release_nothing
+        fh = data
+        if not hasattr(data, 'read'):
+            fh = open(data, 'rb')
+        owned = fh is not data
+        mapped = None
+        try:
+            # the members of a tar file wrap the file of the whole archive
+            if isinstance(getattr(fh, 'raw', fh), FILE_TYPES) and \
+                    'b' in getattr(fh, 'mode', ''):
+                # pipes and sockets cannot tell, only regular files are mapped
+                info = os.fstat(fh.fileno())
+                if stat.S_ISREG(info.st_mode) and info.st_size and \
+                        fh.tell() == 0:
+                    mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            if mapped is None:
+                data = fh.read()
+        finally:
+            if owned and mapped is None:
+                fh.close()
+        if mapped is None:
+            return data, _release_nothing
+
+        def release():
+            mapped.close()
+            if owned:
+                fh.close()
+        return mapped, release
+
+
+    # extracted from 'prep_document'
+    def clean_document(self, body):
+        """
+        Clean 'body' in a single walk over its tree, which does the work of
+        running the cleaner of 'make_cleaner', then 'convert_brs' and
+        'clean_styles': unwanted nodes, attributes and links are dropped,
+        text separated by <br> tags is wrapped in paragraphs and style
+        attributes are removed. Return 'body', or the node that replaced it.
+        """
+        self.clean_attrib(body)
+        todo = [body]
+        while todo:
+            node = todo.pop()
+            children = self.clean_children(node)
             for n in children:
                 if n.tag == 'br':
-                    # snip the trailing text from the br
-                    if n.tail and n.tail.strip():
-                        c = lxml.html.Element('p')
-                        c.text = n.tail
-                        newn.append(c)
-                    continue
-                newn.append(n)
+                    self._split_brs(node, children)
+                    children = node.getchildren()
+                    break
+            todo.extend(children)
+        return body
+
+
+    def clean_root(self, root):
+        """
+        Deal with a document root that 'clean_children' would remove, as
+        the cleaner does: it is emptied or renamed instead.
+        """
+        if root.tag == 'image':
+            root.tag = 'img'
+        if root.tag in KILL_TAGS:
+            if root.tag != 'html':
+                root.tag = 'div'
+            root.clear()
+        elif root.tag not in KNOWN_TAGS:
+            root.tag = 'div'
+            root.attrib.clear()
+
+
+    def clean_children(self, node):
+        """
+        Remove scripts, stylesheet links, comments and processing
+        instructions from the children of 'node', and unwrap the children
+        with unknown tags, the way the cleaner does. Clean the attributes of
+        the remaining children and return them.
+        """
+        kept = []
+        n = node[0] if len(node) else None
+        while n is not None:
+            following = n.getnext()
+            tag = n.tag
+            if tag == 'image':
+                n.tag = tag = 'img'
+            if tag in KILL_TAGS or (tag == 'style' and
+                    n.get('type', '').lower().strip() == 'text/javascript'):
+                n.drop_tree()
+            elif tag not in KNOWN_TAGS:
+                # its children take its place, and are looked at next
+                if len(n):
+                    following = n[0]
+                n.drop_tag()
+            else:
+                self.clean_attrib(n)
+                kept.append(n)
+            n = following
+        return kept
+
+
+    def clean_attrib(self, node):
+        """
+        Drop the event handlers and style attribute of 'node', and the
+        javascript links in its attributes and text, the way the cleaner of
+        'make_cleaner' does.
+        """
+        attrib = node.attrib
+        plain = node.tag not in LINK_TAGS
+        for name in attrib.keys():
+            if name.startswith('on') or name == 'style':
+                del attrib[name]
+            elif plain and name in LINK_ATTRS:
+                value = attrib[name]
+                link = value.strip()
+                if is_javascript_link(link):
+                    link = ''
+                if link != value:
+                    attrib[name] = link
+        if plain:
+            return
+        # as 'rewrite_links' does, but only for 'node' itself, and without
+        # failing on a <param valuetype="ref"> that has no value
+        for el, name, link, pos in node.iterlinks():
+            if el is not node or link is None:
+                continue
+            new = link.strip()
+            if is_javascript_link(new):
+                new = ''
+            if new == link:
+                continue
+            if name is None:
+                node.text = node.text[:pos] + new + node.text[pos + len(link):]
+            else:
+                cur = node.get(name)
+                node.set(name, cur[:pos] + new + cur[pos + len(link):])
+        if node.tag == 'style':
+            old = node.text or ''
+            new = RE_CSS_IMPORT.sub('', RE_CSS_JAVASCRIPT.sub('', old))
+            if has_sneaky_javascript(new):
+                node.text = '/* deleted */'
+            elif new != old:
+                node.text = new
+
+
+    # extracted from 'grab_article'
+    def copy_document(self, body):
+        """
+        Return the equivalent of 'body' in a deep copy of its document. The
+        original prepared tree is left untouched, so it can be handed to a
+        later extraction pass without parsing and prepping the HTML again.
+        """
+        return self._copy_tree(body)
+
+
+    # extracted from 'copy_document'
+    def _copy_tree(self, node):
+        "Return the equivalent of 'node' in a deep copy of its document."
+        path = []
+        parent = node.getparent()
+        while parent is not None:
+            path.append(parent.index(node))
+            node = parent
+            parent = node.getparent()
+        node = copy.deepcopy(node)
+        while path:
+            node = node[path.pop()]
+        return node
+
+
+    def convert_brs(self, node, depth=0):
+        "Convert all text that is siblings of <br> tags to <p>"
+        todo = [node]
+        while todo:
+            n = todo.pop()
+            children = n.getchildren()
+            has_br = 'br' in [c.tag for c in children]
+            if has_br:
+                self._split_brs(n, children)
+                children = n.getchildren()
+            todo.extend(children)
+        return node
+
+
+    # extracted from 'convert_brs'
+    def _split_brs(self, node, children):
+        """
+        Wrap the text around the <br> tags among 'children', the children of
+        'node', in <p> tags, dropping the <br> tags. The text of 'node' and
+        its tail are wrapped too, and whitespace around the <br> tags is
+        dropped.
+        """
+        if node.text and node.text.strip():
+            c = lxml.html.Element('p')
+            c.text = node.text
+            node.insert(0, c)
+        node.text = None
+        for n in children:
+            if n.tag == 'br':
+                # snip the trailing text from the br
                 if n.tail and n.tail.strip():
                     c = lxml.html.Element('p')
                     c.text = n.tail
-                    n.tail = ''
-                    newn.append(c)
-            if node.tail and node.tail.strip():
+                    n.addprevious(c)
+                node.remove(n)
+                continue
+            if n.tail and n.tail.strip():
                 c = lxml.html.Element('p')
-                c.text = node.tail
-                newn.append(c)
-            node.getparent().replace(node, newn)
-            node = newn
-        for n in node.getchildren():
-            self.convert_brs(n, depth + 1)
-        return node
+                c.text = n.tail
+                n.tail = ''
+                n.addnext(c)
+        if node.tail and node.tail.strip():
+            c = lxml.html.Element('p')
+            c.text = node.tail
+            node.append(c)
+        node.tail = None
 
 
-    # line 461 
+    # line 461
     # addFootnotes
 
     # line 537
@@ -290,7 +1285,7 @@ class Readable(object):
     # line 601
     def prep_article(self, content):
         "Prepare 'content' for display."
-        self.clean_styles(content)
+        # styles were removed by 'clean_document'
         self.clean_conditionally(content, "form")
         self.clean(content, 'object')
         self.clean(content, 'h1')
@@ -304,13 +1299,14 @@ class Readable(object):
         self.clean_conditionally(content, 'div')
  
         # line 626: remove extra paragraphs
+        index = self.index
         for n in content.xpath('.//p'):
-            num_img = len(n.xpath('.//img'))
-            num_embed = len(n.xpath('.//embed'))
-            num_object = len(n.xpath('.//object'))
+            num_img = index.tag_count(n, 'img')
+            num_embed = index.tag_count(n, 'embed')
+            num_object = index.tag_count(n, 'object')
             if num_img == 0 and num_embed == 0 and num_object == 0:
-                if not self.get_inner_text(n, 0):
-                    n.getparent().remove(n)
+                if not self.index.has_text(n):
+                    self.remove_node(n)
 
         # line 639
         # kill breaks already done above
@@ -318,10 +1314,17 @@ class Readable(object):
 
     # line 653
     def initialize_node(self, node):
-        "Add readable's attributes to 'node'."
-        score = 0
+        "Record an initial score for 'node' in the score table."
         if node is None:
             return
+        self.scores[node] = self.get_tag_score(node) + \
+            self.get_class_weight(node)
+
+
+    # extracted from 'initialize_node'
+    def get_tag_score(self, node):
+        "Return the initial score of 'node' for its tag."
+        score = 0
         if node.tag == 'div':
             score += 5
         elif node.tag in set(['pre','td','blockquote']):
@@ -330,25 +1333,47 @@ class Readable(object):
             score -= 3
         elif node.tag in set(['h1','h2','h3','h4','h5','h6','th']):
             score -= 5
-        score += self.get_class_weight(node)
-        node.readable = Bag(score=score)
+        return score
 
 
-    # line 701
-    def _grab_article(self, data):
+    # extracted from 'grab_article'
+    def score_document(self, body):
         """
-        This performs the core extraction, and is potentially called by
-        'grab_article' multiple times, relaxing extraction flags on each
-        pass.
+        Select the nodes of 'body', a prepared document, and score them
+        without applying any flag dependent part. Return the ScoredTree.
         """
-        body = self.prep_document(data)
+        self.reset()
+        return self.score_nodes(self.select_scorable(body), body)
 
-        # line 720 - 766 - moved into method 'select_scorable'
-        to_score = self.select_scorable(body)
-        
-        # line 774
-        content = self.score_paras(to_score, body)
-        return content
+
+    # extracted from 'grab_article'
+    def copy_scored(self, scored):
+        """
+        Return a copy of 'scored', a ScoredTree, over a deep copy of its
+        tree, so a pass can extract from it while the original is kept for
+        later passes. The node index and score columns are carried over to
+        the matching nodes of the copy.
+        """
+        body = self._copy_tree(scored.body)
+        copy = ScoredTree(body, NodeIndex())
+        stats = scored.index.stats
+        cstats = copy.index.stats
+        wanted = set(scored.candidates)
+        nodes = {}
+        pairs = zip(scored.body.getroottree().getroot().iter(),
+            body.getroottree().getroot().iter())
+        for old, new in pairs:
+            rec = stats.get(old)
+            if rec is not None:
+                cstats[new] = rec
+            if old in wanted:
+                nodes[old] = new
+        copy.candidates = [nodes[n] for n in scored.candidates]
+        # the features are never modified, so they can be shared
+        for name in ScoredTree.PARAGRAPHS + ScoredTree.COLUMNS:
+            setattr(copy, name, getattr(scored, name))
+        copy.content = scored.content
+        return copy
 
 
     # line 720
@@ -357,9 +1382,17 @@ class Readable(object):
         to_score = []
         nodeiter = NodeIter(node)
         para_attrs = {'class': 'readable-styled'}
+        deadline = self.deadline
         for idx, n in nodeiter:
+            if deadline is not None and not idx & 255 and \
+                    time.time() >= deadline:
+                raise OutOfTime()
             if self.is_unlikely(n):
-                self.log('Removing unlikely candidate - ' + self.get_info(n))
+                if self.debug:
+                    self.log('Removing unlikely candidate - ' +
+                        self.get_info(n))
+                if self.trace is not None:
+                    self.trace['unlikely'] += 1
                 nodeiter.remove()
                 continue
 
@@ -369,108 +1402,159 @@ class Readable(object):
 
             # line 738
             if n.tag == 'div':
-                if not n.xpath(XPATH_REPL_PARAS):
-                    newn = self.node_copy(n)
-                    newn.tag = 'p'
-                    n.getparent().replace(n, newn)
-                    nodeiter.backup()
-                    nodeiter.refresh()
-                    to_score.append(newn)
+                # stop at the first block, rather than finding them all
+                if next(n.iterdescendants(*_REPL_PARAS), None) is None:
+                    n.tag = 'p'
+                    nodeiter.revisit()
+                    to_score.append(n)
                 else:
-                    to_score += self._paragraphize_text(n)
-                    nodeiter.refresh()
+                    self._paragraphize_text(n)
 
         return to_score
 
 
     # line 754 (marked EXPERIMENTAL)
     def _paragraphize_text(self, node):
-        "Wraps text children of 'node' in <p>"
-        to_score = []
-        newn = lxml.html.Element(node.tag, node.attrib)
+        "Wrap the text children of 'node', and its tail, in <p> tags."
         if node.text:
             el = lxml.html.Element('p')
             el.set('class', 'readability-styled')
             el.text = node.text
-            node.text = ''
-            newn.append(el)
+            node.text = None
+            node.insert(0, el)
         for c in node.getchildren():
-            newn.append(c)
             if c.tail:
                 el = lxml.html.Element('p')
                 el.set('class', 'readability-styled')
                 el.text = c.tail
                 c.tail = ''
-                newn.append(el)
+                c.addnext(el)
         if node.tail:
             el = lxml.html.Element('p')
             el.set('class', 'readability-styled')
             el.text = node.tail
-            node.tail = ''
-            newn.append(el)
-        node.getparent().replace(node, newn)
-        return to_score
+            node.append(el)
+        node.tail = None
 
 
     # line 775
     def score_paras(self, nodes, body):
         "Score all 'nodes' according to various metrics."
-        candidates = []
+        scored = self.score_nodes(nodes, body)
+        return self._select_top(self.apply_scores(scored), body)
+
+
+    # extracted from 'score_paras'
+    def score_nodes(self, nodes, body):
+        """
+        Take the features of the paragraphs 'nodes' of 'body' and of the
+        candidates found, and return the ScoredTree holding them.
+        """
+        scored = ScoredTree(body, self.index)
+        candidates = scored.candidates
+        base = scored.base
+        # position of each candidate in 'candidates'
+        positions = {}
         for n in nodes:
             parent = n.getparent()
             if parent is None:
                 continue
-            gparent = None
-            if parent is not None:
-                gparent = parent.getparent()
-            text = self.get_inner_text(n)
-            if len(text) < 25:
+            gparent = parent.getparent()
+            text_len = self.get_text_length(n)
+            if text_len < 25:
                 continue
-            if parent is not None and not self.is_readable(parent):
-                self.initialize_node(parent)
-                candidates.append(parent)
-            if gparent is not None and not self.is_readable(gparent):
-                self.initialize_node(gparent)
-                candidates.append(gparent)
-
-            # line 809
+            for c in (parent, gparent):
+                if c is not None and c not in positions:
+                    positions[c] = len(candidates)
+                    base.append(self.get_tag_score(c))
+                    candidates.append(c)
+            scored.lengths.append(text_len)
+            scored.commas.append(self.get_char_count(n, ','))
+            scored.parents.append(positions[parent])
+            scored.gparents.append(-1 if gparent is None else
+                positions[gparent])
+
+        # line 824
+        for n in candidates:
+            scored.weight.append(self._class_weight(n))
+            scored.density.append(self.get_link_density(n))
+        return scored
+
+
+    # line 809
+    def score_content(self, scored):
+        """
+        Return the sums of the scores of the paragraphs below each
+        candidate of 'scored', a ScoredTree, aligned with its candidates.
+        """
+        content = [0] * len(scored.candidates)
+        paras = zip(scored.lengths, scored.commas, scored.parents,
+            scored.gparents)
+        for text_len, commas, parent, gparent in paras:
             score = 0
             score += 1
-            score += len(text.split(','))
-            score += min(math.floor(len(text) / 100.0), 3)
-            parent.readable.score += score
-            if gparent is not None:
-                gparent.readable.score += score / 2.0
+            score += commas + 1
+            score += min(math.floor(text_len / 100.0), 3)
+            content[parent] += score
+            if gparent >= 0:
+                content[gparent] += score / 2.0
+        return content
 
-        return self._select_top(candidates, body)
+
+    # extracted from 'score_paras'
+    def apply_scores(self, scored):
+        """
+        Record the scores of the candidates of 'scored', a ScoredTree, under
+        the current flags in the score table, and return the candidates.
+        """
+        if scored.content is None:
+            scored.content = self.score_content(scored)
+        weighted = self.flags & self.FLAG_CLASS_WEIGHT
+        scores = self.scores
+        columns = zip(scored.candidates, scored.base, scored.weight,
+            scored.content, scored.density)
+        for n, base, weight, content, density in columns:
+            score = base
+            if weighted:
+                score += weight
+            scores[n] = (score + content) * (1 - density)
+        if self.trace is not None:
+            self.trace['candidates'] += len(scored.candidates)
+        return scored.candidates
 
 
     # extracted from 'score_paras'
     def _select_top(self, candidates, body):
-        "Select the top (best) node from the candidates."
-        # line 824
+        "Select the top (best) node from the scored candidates."
+        # line 824, link densities are applied by 'apply_scores'
         top = None
         for n in candidates:
-            n.readable.score *= (1 - self.get_link_density(n))
-            self.log('Candidate: ' + self.get_info(n) + 
-                ' with score %.2f' % n.readable.score)
-            if top is None or (n.readable.score > top.readable.score):
+            if self.debug:
+                self.log('Candidate: ' + self.get_info(n) +
+                    ' with score %.2f' % self.scores[n])
+            if top is None or (self.scores[n] > self.scores[top]):
                 top = n
 
         # line 843
         content = lxml.html.Element('div')
         if top is None or top.tag == 'body':
             top = lxml.html.Element('div')
+            self.index.invalidate(body)
             for n in body.getchildren():
                 top.append(n)
             body.append(top)
             self.initialize_node(top)
             self.initialize_node(body)
+        else:
+            self.top = top
+            if self.profiles is not None:
+                self.top_path = self.get_signature_path(top)
 
         # line 859
-        sib_thresh = max(10, top.readable.score * 0.2)
+        sib_thresh = max(10, self.scores[top] * 0.2)
 
         # loop over siblings of 'top', looking for any that are promising.
+        altered = []
         for n in top.getparent().getchildren():
             append = 0
             if n is None:
@@ -478,16 +1562,17 @@ class Readable(object):
 
             # line 874
             # logging to match that found in original source
-            msg = 'Looking at sibling node: ' + self.get_info(n)
-            if self.is_readable(n):
-                msg += ' with score %.2f' % n.readable.score
-            self.log(msg)
-            msg = "Sibling has score "
-            if self.is_readable(n):
-                msg += '%.2f' % n.readable.score
-            else:
-                msg += 'Unknown'
-            self.log(msg)
+            if self.debug:
+                msg = 'Looking at sibling node: ' + self.get_info(n)
+                if self.is_readable(n):
+                    msg += ' with score %.2f' % self.scores[n]
+                self.log(msg)
+                msg = "Sibling has score "
+                if self.is_readable(n):
+                    msg += '%.2f' % self.scores[n]
+                else:
+                    msg += 'Unknown'
+                self.log(msg)
 
             if n == top:
                 append = 1
@@ -497,54 +1582,618 @@ class Readable(object):
             tclass = top.get('class', '')
             nclass = n.get('class', '')
             if nclass == tclass and tclass:
-                bonus += top.readable.score * 0.2
-            if self.is_readable(n) and (n.readable.score + bonus) >= sib_thresh:
+                bonus += self.scores[top] * 0.2
+            if self.is_readable(n) and (self.scores[n] + bonus) >= sib_thresh:
                 append = 1
 
             # line 891
             if n.tag == 'p':
                 link_density = self.get_link_density(n)
-                text = self.get_inner_text(n)
-                text_len = len(text)
+                text_len = self.get_text_length(n)
                 if text_len > 80 and link_density < 0.25:
                     append = 1
                 elif text_len < 80 and link_density == 0 and \
-                        RE_SENT.search(text):
+                        RE_SENT.search(self.get_inner_text(n)):
                     append = 1
 
             # line 904
             if append:
-                self.log("Appending node: " + self.get_info(n))
+                if self.debug:
+                    self.log("Appending node: " + self.get_info(n))
                 if n.tag not in ('div', 'p'):
-                    self.log("Altering siblingNode of " + n.tag + " to div.")
-                    el = self.node_copy(n)
-                    el.tag = 'div'
-                    n = el
-                n.set('class', '')
+                    if self.debug:
+                        self.log("Altering siblingNode of " + n.tag +
+                            " to div.")
+                    altered.append(n)
+                else:
+                    n.set('class', '')
+                self.index.invalidate(n.getparent())
                 content.append(n)
 
+        # these used to be appended as copies, which had no scores, while
+        # the nodes themselves were left alone during the loop above
+        scores = self.scores
+        for n in altered:
+            for c in n.iter():
+                scores.pop(c, None)
+            n.tag = 'div'
+            n.set('class', '')
+
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise OutOfTime(content)
         self.prep_article(content)
         return content
 
 
     # line 952
-    def grab_article(self, data):
-        "Find the readable content in 'data', a string containing HTML."
+    def grab_article(self, data, url=None):
+        """
+        Find the readable content in 'data', HTML given as a string, bytes,
+        a buffer such as mmap, a binary file object or a path (see
+        'open_input'). With profiles, the place where the content was found
+        on earlier pages from the host of 'url' is tried first.
+        """
+        return self.grab(data, url).content
+
+
+    # extracted from 'grab_article'
+    def grab(self, data, url=None):
+        """
+        Find the readable content in 'data' as 'grab_article' does, and
+        return it in an Article along with the title, text direction and
+        metadata of the page, read while it is prepped. A relative
+        canonical url is resolved against 'url'.
+        """
+        # all state of this call, including the flags relaxed below, lives
+        # in its own context.
+        return self._grab(data, url).get_article(url)
+
+
+    def _grab(self, data, url):
+        "Return a new context, holding the article found in 'data'."
+        ctx = self.context()
+        ctx.grab_steps(data, url)
+        return ctx
+
+
+    def get_article(self, url=None):
+        """
+        Return the Article found by the last 'grab_steps' of this context,
+        its canonical url resolved against 'url', or as written in the page
+        without 'url'.
+        """
+        return resolve_canonical(Article(self.article, budgets=self.budgets,
+            **self.metadata), url)
+
+
+    # extracted from 'grab_article'
+    def grab_steps(self, data, url=None):
+        """
+        Run the passes of 'grab_article' on 'data' in this context. The
+        content found is left in 'article', and the title and metadata of
+        the page in 'metadata'.
+        """
+        self.article = None
+        self.metadata = None
+        self.budgets = ()
         flags = list(self.FLAGS)
         flags.reverse()
-        content = None
-        text = ''
-        while len(text) < 250:
-            flag = flags.pop()
-            self.flags &= ~flag
-            content = self._grab_article(data)
-            # if no more flags can be cleared, take what we can get
-            if not flags:
-                break
-            text = self.get_inner_text(content, 0)
+        data, release = self.open_input(data)
+        size = len(data)
+        budget = self.budget
+        # names of the budgets that ran out
+        spent = []
+        if self.metrics is not None or budget is not None:
+            start = time.time()
+        self.deadline = None
+        if budget is not None and budget.max_seconds is not None:
+            self.deadline = start + budget.max_seconds
+        # counters of each pass run, when collecting metrics
+        passes = None
+        if self.metrics is not None:
+            passes = []
+        if budget is not None and budget.max_bytes is not None and \
+                size > budget.max_bytes:
+            data = data[:budget.max_bytes]
+            spent.append('bytes')
+        learn = self.profiles is not None and url is not None
+        profile = None
+        # the content with the most text so far, for when the budget
+        # leaves no room for another pass
+        best = None
+        best_length = -1
+        try:
+            # parse and prep once. each pass that may be followed by another
+            # one extracts from a copy of the prepared tree, the last pass
+            # consumes it.
+            body = self._prep_budgeted(data, spent)
+            content = None
+            text = ''
+            if self.deadline is not None and time.time() >= self.deadline:
+                raise OutOfTime()
+            if learn:
+                profile = self.profiles.lookup(url)
+            if profile is not None:
+                top = self.find_signature_path(body, profile.path)
+                if top is not None:
+                    content = self._grab_profiled(body, top, profile.flags)
+                    if content is None:
+                        # scoring changed the tree, start over
+                        body = self._prep_budgeted(data, spent)
+                self.profiles.report(url, content is not None)
+                if content is not None:
+                    text = self.get_inner_text(content, 0)
+                    learn = False
+                    best = content
+                    best_length = len(text)
+            num = 0
+            # the tree scored for the passes keeping unlikely nodes
+            shared = None
+            while len(text) < 250:
+                if budget is not None:
+                    name = budget.exhausted(num, time.time() - start)
+                    if name is not None:
+                        spent.append(name)
+                        content = best
+                        if content is None:
+                            content = self._body_content(body)
+                        learn = False
+                        break
+                flag = flags.pop()
+                self.flags &= ~flag
+                if passes is not None:
+                    self.trace = {'flags': self.flags, 'candidates': 0,
+                        'unlikely': 0, 'removed': 0, 'text_length': 0}
+                    passes.append(self.trace)
+                num += 1
+                # no copy is needed for the last pass the budget allows
+                last = not flags or (budget is not None and
+                    budget.max_passes is not None and num >= budget.max_passes)
+                # line 701
+                if self.flags & self.FLAG_STRIP_UNLIKELY:
+                    if not last:
+                        scored = self.score_document(self.copy_document(body))
+                    else:
+                        scored = self.score_document(body)
+                else:
+                    # once unlikely nodes are kept, passes select and score
+                    # the same paragraphs and only differ in class weights
+                    # and cleaning, so the tree is scored once. the flag is
+                    # not set again, so 'body' itself can be scored.
+                    if shared is None:
+                        shared = self.score_document(body)
+                    if not last:
+                        scored = self.copy_scored(shared)
+                    else:
+                        scored = shared
+                self.reset()
+                self.index = scored.index
+                content = self._select_top(self.apply_scores(scored),
+                    scored.body)
+                # if no more flags can be cleared, take what we can get
+                if not flags and passes is None and not learn:
+                    break
+                text = self.get_inner_text(content, 0)
+                if passes is not None:
+                    self.trace['text_length'] = len(text)
+                if len(text) > best_length:
+                    best = content
+                    best_length = len(text)
+                if not flags:
+                    break
+            if spent and self.debug:
+                self.log('Budget exhausted: ' + ', '.join(spent))
+            if learn:
+                path = None
+                if len(text) >= 250 and self.top_path:
+                    path = self.top_path
+                self.profiles.learn(url, path, self.flags)
+        except OutOfTime as exc:
+            spent.append('seconds')
+            content = exc.content
+            if content is None:
+                content = best
+            if content is None:
+                content = self._body_content(body)
+            if self.debug:
+                self.log('Budget exhausted: ' + ', '.join(spent))
+        finally:
+            self.flush_log()
+            release()
+        if passes is not None:
+            stats = {'bytes': size, 'seconds': time.time() - start,
+                'passes': passes}
+            if profile is not None:
+                stats['profile'] = 'fallback' if passes else 'hit'
+            if spent:
+                stats['budgets'] = spent
+            self.metrics.document(stats)
+        self.article = content
+        self.budgets = tuple(spent)
+
+
+    def _body_content(self, body):
+        "Return the content of 'body' when no pass found content in time."
+        content = lxml.html.Element('div')
+        content.text = body.text
+        body.text = None
+        for n in body.getchildren():
+            content.append(n)
         return content
 
 
+    def _prep_budgeted(self, data, spent):
+        """
+        Prep the document in 'data', cut down to the node budget, if any.
+        'nodes' is added to the list 'spent' when nodes were dropped.
+        """
+        body = self.prep_document(data)
+        max_nodes = self.budget and self.budget.max_nodes
+        if max_nodes is not None and self.truncate_document(body, max_nodes):
+            if 'nodes' not in spent:
+                spent.append('nodes')
+        return body
+
+
+    def truncate_document(self, root, max_nodes):
+        """
+        Drop the nodes of 'root' that come after the first 'max_nodes' of
+        its descendants in document order, along with the text following
+        them. Return whether any were dropped.
+        """
+        node = root
+        if max_nodes > 0:
+            node = None
+            for i, n in enumerate(root.iterdescendants()):
+                if i + 1 == max_nodes:
+                    node = n
+                    break
+            if node is None:
+                return False
+        dropped = False
+        for n in node.getchildren():
+            node.remove(n)
+            dropped = True
+        while node is not root:
+            parent = node.getparent()
+            n = node.getnext()
+            while n is not None:
+                following = n.getnext()
+                parent.remove(n)
+                dropped = True
+                n = following
+            node = parent
+        return dropped
+
+
+    def _grab_profiled(self, body, top, flags):
+        """
+        Extract from 'body' as a site profile says: score 'top', the node
+        where earlier pages of the site had their content, along with its
+        siblings, under the 'flags' it was found with. Return the content,
+        or None if another node wins or 'top' holds too little text, in
+        which case 'body' is left partly extracted.
+        """
+        saved = self.flags
+        self.flags = flags
+        try:
+            self.reset()
+            content = self.score_paras(self.select_scorable(top.getparent()),
+                body)
+        finally:
+            self.flags = saved
+        if self.top is not top or len(self.get_inner_text(content, 0)) < 250:
+            return None
+        return content
+
+
+    def extract(self, data, output='html', stream=None, encoding='utf-8',
+            url=None):
+        """
+        Find the readable content in 'data', fetched from 'url' if known,
+        and return it serialized as described in 'serialize'. With a cache,
+        the serialized content is looked up there first, and stored there
+        when extracted.
+        """
+        if self.cache is None:
+            return self.serialize(self.grab_article(data, url), output,
+                stream, encoding)
+        if output not in OUTPUTS:
+            raise ValueError('unknown output %r' % (output,))
+        if output == 'paragraphs' and stream is not None:
+            raise ValueError('paragraphs cannot be written to a stream')
+        data, release = self.open_input(data)
+        try:
+            key = self.cache_key(data, output)
+            value = self.cache.get(key)
+            if value is None:
+                start = time.time()
+                value = self._cache_content(key, self.grab_article(data, url),
+                    output, start)
+        finally:
+            release()
+        value = self._cached_output(value, output)
+        if stream is None:
+            return value
+        stream.write(self._encode(value, output, encoding))
+
+
+    def _cache_content(self, key, content, output, start):
+        """
+        Store the 'output' of 'content', extracted since 'start', in the
+        cache under 'key', and return the value stored.
+        """
+        value = self.serialize(content, output)
+        if output == 'paragraphs':
+            value = json.dumps([list(p) for p in value])
+        self._cache_put(key, value, start)
+        return value
+
+
+    def _cache_put(self, key, value, start):
+        "Store 'value', extracted since 'start', in the cache under 'key'."
+        # what the time budget may have cut short is not kept
+        budget = self.budget
+        if budget is None or budget.max_seconds is None or \
+                time.time() - start < budget.max_seconds:
+            self.cache.put(key, value)
+
+
+    def extract_article(self, data, output='html', url=None):
+        """
+        Find the readable content in 'data', fetched from 'url' if known,
+        and return an Article holding it serialized as described in
+        'serialize', along with the title and metadata of the page. With a
+        cache, the Article is looked up there first, and stored there when
+        extracted.
+        """
+        if output not in OUTPUTS:
+            raise ValueError('unknown output %r' % (output,))
+        data, release = self.open_input(data)
+        try:
+            if self.cache is None:
+                article = self.grab(data, url)
+                return article._replace(content=self.serialize(
+                    article.content, output))
+            # the canonical url is stored as written, 'url' not being part
+            # of the key
+            key = self.cache_key(data, 'article/' + output)
+            value = self.cache.get(key)
+            if value is None:
+                start = time.time()
+                article = self._grab(data, url).get_article()
+                fields = article._asdict()
+                fields['content'] = self.serialize(article.content, output)
+                value = json.dumps(fields)
+                self._cache_put(key, value, start)
+        finally:
+            release()
+        fields = json.loads(value)
+        if output == 'paragraphs':
+            fields['content'] = [Paragraph(*p) for p in fields['content']]
+        return resolve_canonical(Article(**fields), url)
+
+
+    def _cached_output(self, value, output):
+        "Return the 'output' stored in the cache as 'value'."
+        if output == 'paragraphs':
+            return [Paragraph(*p) for p in json.loads(value)]
+        return value
+
+
+    def cache_key(self, data, output):
+        """
+        Return the key of the 'output' of 'data' in the cache: a hash of
+        the page, the flags, the output mode, the rule versions and the
+        size limits of the budget.
+        """
+        kind = 'b'
+        if isinstance(data, TEXT):
+            # parsed without looking for a charset, unlike bytes
+            kind = 'u'
+            data = data.encode('utf-8')
+        limits = None
+        if self.budget is not None:
+            limits = (self.budget.max_bytes, self.budget.max_nodes,
+                self.budget.max_passes)
+        digest = hashlib.sha256(('%s\0%s\0%d\0%s\0%s\0%r\0' % (__version__,
+            UPSTREAM_VERSION, self.flags, output, kind, limits))
+            .encode('ascii'))
+        digest.update(data)
+        return digest.hexdigest()
+
+
+    def serialize(self, content, output='html', stream=None,
+            encoding='utf-8'):
+        """
+        Serialize 'content', as returned by 'grab_article': to a unicode
+        string of its markup when 'output' is 'html', or of its normalized
+        text when 'output' is 'text', or to a list of Paragraph when
+        'output' is 'paragraphs'. The text outputs are read straight from
+        the tree, without serializing the markup.
+
+        When a binary 'stream' is given, the html or text is written to it
+        encoded with 'encoding' instead, and None is returned. Characters
+        the encoding lacks are written as character references in markup,
+        and raise UnicodeEncodeError in text.
+        """
+        if output not in OUTPUTS:
+            raise ValueError('unknown output %r' % (output,))
+        if output == 'paragraphs':
+            if stream is not None:
+                raise ValueError('paragraphs cannot be written to a stream')
+            return self.get_paragraphs(content)
+        if stream is None:
+            if output == 'html':
+                return lxml.html.tostring(content, encoding='unicode')
+            return self.get_inner_text(content)
+        if output == 'html' and codecs.lookup(encoding).name == 'utf-8':
+            # libxml2 encodes utf-8 itself, but does not know all the
+            # names Python has for other encodings
+            stream.write(lxml.html.tostring(content, encoding='utf-8'))
+        else:
+            stream.write(self._encode(self.serialize(content, output),
+                output, encoding))
+
+
+    def _encode(self, value, output, encoding):
+        "Encode the serialized 'output' 'value' as described in 'serialize'."
+        if output == 'html':
+            return value.encode(encoding, 'xmlcharrefreplace')
+        return value.encode(encoding)
+
+
+    def extract_chunk(self, chunk, output='html'):
+        """
+        Extract each (index, data) pair in 'chunk', returning a list of
+        Result, one per document. Errors are captured per document.
+        """
+        results = []
+        for index, data in chunk:
+            try:
+                results.append(Result(index, self.extract(data, output), None))
+            except Exception:
+                results.append(Result(index, None, traceback.format_exc()))
+        return results
+
+
+    def extract_many(self, documents, workers=None, chunksize=1, ordered=True,
+            output='html'):
+        """
+        Extract every HTML string in the iterable 'documents', spreading the
+        work over a pool of 'workers' processes (default: one per CPU), and
+        yield a Result for each. Documents are sent to the workers
+        'chunksize' at a time. Results come in input order if 'ordered' is
+        set, otherwise as soon as they are ready. Documents are read from
+        'documents' only as workers become free, so memory use stays bounded
+        however many there are. When a whole chunk fails, because one of its
+        documents cannot be pickled or its worker died, each document of the
+        chunk gets a Result with the error.
+        """
+        chunks = self._chunks(documents, chunksize)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 1:
+            for num, chunk in chunks:
+                for res in self.extract_chunk(chunk, output):
+                    yield res
+            return
+
+        # chunks of each document, until the chunk is done
+        indices = {}
+        # (num, results, metrics, error) of each chunk done
+        done = queue.Queue()
+        pool = self._start_pool(workers, output)
+        try:
+            window = workers * 2
+            ready = {}
+            head = 0
+            exhausted = False
+            while True:
+                while not exhausted and len(indices) + len(ready) < window:
+                    try:
+                        num, chunk = next(chunks)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    indices[num] = [index for index, data in chunk]
+                    pool = self._submit_chunk(pool, num, chunk, done,
+                        workers, output)
+                if not indices:
+                    break
+                # a timeout keeps the wait interruptible
+                while True:
+                    try:
+                        num, results, metrics, error = done.get(timeout=60)
+                        break
+                    except queue.Empty:
+                        pass
+                if error is not None:
+                    results = [Result(index, None, error)
+                        for index in indices[num]]
+                del indices[num]
+                if metrics is not None:
+                    self.metrics.merge(metrics)
+                if not ordered:
+                    for res in results:
+                        yield res
+                    continue
+                ready[num] = results
+                while head in ready:
+                    for res in ready.pop(head):
+                        yield res
+                    head += 1
+        finally:
+            if ProcessPoolExecutor is None:
+                pool.terminate()
+                pool.join()
+            else:
+                try:
+                    pool.shutdown(cancel_futures=True)
+                except TypeError:
+                    # before Python 3.9
+                    pool.shutdown()
+
+
+    # extracted from 'extract_many'
+    def _start_pool(self, workers, output):
+        "Start the worker processes of 'extract_many'."
+        if ProcessPoolExecutor is None:
+            return multiprocessing.Pool(workers, _init_worker, (self, output))
+        return ProcessPoolExecutor(workers, initializer=_init_worker,
+            initargs=(self, output))
+
+
+    # extracted from 'extract_many'
+    def _submit_chunk(self, pool, num, chunk, done, workers, output):
+        """
+        Send chunk 'num' to the worker processes of 'pool', whose outcome is
+        put on the queue 'done', and return the pool, which is replaced when
+        a worker died. A chunk that cannot be sent, that fails in a worker
+        or that a dying worker takes with it is put there with its error.
+        """
+        if ProcessPoolExecutor is None:
+            # pickled here, an error is not lost in the pool's own thread
+            try:
+                payload = pickle.dumps((num, chunk), pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                done.put((num, None, None, traceback.format_exc()))
+            else:
+                pool.apply_async(_extract_pickled, (num, payload),
+                    callback=done.put)
+            return pool
+
+        def finished(future):
+            try:
+                done.put(future.result())
+            except Exception:
+                done.put((num, None, None, traceback.format_exc()))
+
+        try:
+            future = pool.submit(_extract_chunk, (num, chunk))
+        except RuntimeError:
+            # a worker died, which broke the pool
+            pool.shutdown(wait=False)
+            pool = self._start_pool(workers, output)
+            future = pool.submit(_extract_chunk, (num, chunk))
+        future.add_done_callback(finished)
+        return pool
+
+
+    def _chunks(self, documents, chunksize):
+        "Yield numbered lists of (index, data) pairs from 'documents'."
+        chunk = []
+        num = 0
+        for index, data in enumerate(documents):
+            chunk.append((index, data))
+            if len(chunk) >= chunksize:
+                yield num, chunk
+                chunk = []
+                num += 1
+        if chunk:
+            yield num, chunk
+
+
     # line 979
     # removeScripts
 
@@ -558,70 +2207,267 @@ class Readable(object):
         return text.strip()
 
 
+    # extracted from 'get_inner_text'
+    def get_paragraphs(self, node):
+        """
+        Split the normalized inner text of 'node' into paragraphs at the
+        boundaries of its block elements, returning a list of Paragraph.
+        """
+        # runs of raw text, with the innermost block holding each
+        parts = []
+        blocks = [node]
+        events = ('start', 'end', 'comment', 'pi')
+        for event, n in lxml.etree.iterwalk(node, events=events):
+            if event == 'start':
+                block = blocks[-1]
+                if n.tag in BLOCK_TAGS:
+                    block = n
+                blocks.append(block)
+                if n.text:
+                    parts.append((n.text, block))
+                continue
+            if event == 'end':
+                blocks.pop()
+            # the text of comments and instructions is not content
+            if n.tail and n is not node:
+                parts.append((n.tail, blocks[-1]))
+
+        # raw offsets where a new block starts
+        starts = []
+        pos = 0
+        for text, block in parts:
+            if not starts or block is not starts[-1][1]:
+                starts.append((pos, block))
+            pos += len(text)
+
+        # map them into the text normalized as in 'get_inner_text'
+        raw = ''.join([text for text, block in parts])
+        text = RE_NORMALIZE.sub(' ', raw)
+        lead = len(text) - len(text.lstrip())
+        text = text.strip()
+        spaces = RE_NORMALIZE.finditer(raw)
+        space = next(spaces, None)
+        shift = lead
+        offsets = []
+        for pos, block in starts:
+            while space is not None and space.end() <= pos:
+                shift += space.end() - space.start() - 1
+                space = next(spaces, None)
+            if space is not None and space.start() < pos:
+                pos = space.start()
+            offsets.append(min(max(pos - shift, 0), len(text)))
+        offsets.append(len(text))
+
+        paras = []
+        for i, (pos, block) in enumerate(starts):
+            start, end = offsets[i], offsets[i + 1]
+            chunk = text[start:end]
+            start += len(chunk) - len(chunk.lstrip())
+            end -= len(chunk) - len(chunk.rstrip())
+            if start < end:
+                paras.append(Paragraph(text[start:end], start, end,
+                    block.tag))
+        return paras
+
+
+    def get_text_length(self, node):
+        "Return the length of the normalized inner text of 'node'."
+        return self.index.text_length(node)
+
+
     # line 1030
     def get_char_count(self, node, char):
+        if char == ',':
+            return self.index.comma_count(node)
         return len(self.get_inner_text(node).split(char)) - 1
 
 
     # line 1042
     def clean_styles(self, node):
-        if 'style' in node.attrib:
-            del node.attrib['style']
-        for n in list(node.iterchildren()):
-            self.clean_styles(n)
+        for n in node.iter(lxml.etree.Element):
+            if 'style' in n.attrib:
+                del n.attrib['style']
 
 
     # line 1075
     def get_link_density(self, node):
-        links = node.xpath('.//a')
-        textlen = len(self.get_inner_text(node))
+        textlen = self.get_text_length(node)
         if textlen == 0:
             return 0
-        linklen = 0
-        for link in links:
-            linklen += len(self.get_inner_text(link))
-        return linklen / float(textlen)
+        return self.index.link_length(node) / float(textlen)
 
 
     # line 1092
-    # findBaseUrl - part of "next page downloading"
+    def find_base_url(self, url):
+        """
+        Return 'url' without the page number, file type or 'index' name of
+        its last path segments: the url of the first page of a paginated
+        article.
+        """
+        parts = urlsplit(url)
+        segments = parts.path.split('/')
+        segments.reverse()
+        cleaned = []
+        for i, segment in enumerate(segments):
+            # split off anything that looks like a file type
+            if '.' in segment:
+                possible_type = segment.split('.')[1]
+                if not re.search('[^a-zA-Z]', possible_type):
+                    segment = segment.split('.')[0]
+
+            # EW-CMS urls, e.g. /ew/article/0,,20313460_20369436,00.html
+            if ',00' in segment:
+                segment = segment.replace(',00', '', 1)
+
+            # a page number ending one of the last two segments
+            if i < 2 and RE_PAGE_SEGMENT.search(segment):
+                segment = RE_PAGE_SEGMENT.sub('', segment, 1)
+
+            delete = False
+            # a number alone in one of the last two segments is a page number
+            if i < 2 and re.match(r'\d{1,2}$', segment):
+                delete = True
+            if i == 0 and segment.lower() == 'index':
+                delete = True
+            # a short segment after a last segment without any letter
+            if i < 2 and len(segment) < 3 and \
+                    not re.search('[a-z]', segments[0], re.I):
+                delete = True
+            if not delete:
+                cleaned.append(segment)
+
+        cleaned.reverse()
+        return '%s://%s%s' % (parts.scheme, parts.netloc, '/'.join(cleaned))
+
 
     # line 1157
-    # findNextPageLink - paging function. may implement this eventually as part
-    # of another layer, e.g. when the page is downloaded do a quick scan for
-    # the next page, download it, then extract each of the N pages using
-    # readable.
+    def find_next_page_link(self, elem, url, parsed):
+        """
+        Return the url of the link below 'elem' most likely to lead to the
+        next page of the article at 'url', or None when no link scores 50 or
+        more. Links to the urls of 'parsed', the set of pages already part
+        of the article, are ignored, and the url found is added to it.
+        """
+        possible = collections.OrderedDict()
+        base_url = self.find_base_url(url)
+        host = urlsplit(url).netloc
+
+        # look for hints that links lead to the next page: 'page' in their
+        # text, class or id, or in the class or id of their parents.
+        for link in elem.iter('a'):
+            href = link.get('href')
+            if not href:
+                continue
+            link_href = urljoin(url, href.strip()).split('#', 1)[0]
+            if link_href.endswith('/'):
+                link_href = link_href[:-1]
 
-    # line 1329
-    # xhr - part of "next page downloading"
+            # pages already seen and other sites are skipped
+            if not link_href or link_href == base_url or link_href == url or \
+                    link_href in parsed:
+                continue
+            link_parts = re.split('/+', link_href)
+            if len(link_parts) < 2 or link_parts[1] != host:
+                continue
+
+            link_text = self.get_inner_text(link)
+            if RE_EXTRANEOUS.search(link_text) or len(link_text) > 25:
+                continue
+
+            # without a digit after the base url, it is not a next page link
+            if not re.search(r'\d', link_href.replace(base_url, '', 1)):
+                continue
+
+            page = possible.get(link_href)
+            if page is None:
+                page = possible[link_href] = {'score': 0, 'text': link_text,
+                    'href': link_href}
+            else:
+                page['text'] += ' | ' + link_text
+
+            # a link outside the base url may still be it, at lower odds
+            if not link_href.startswith(base_url):
+                page['score'] -= 25
+
+            link_data = ' '.join((link_text, link.get('class', ''),
+                link.get('id', '')))
+            if RE_NEXT_LINK.search(link_data):
+                page['score'] += 50
+            if RE_PAGING.search(link_data):
+                page['score'] += 25
+            # enough to negate a > or \xbb, unless 'next' was matched before
+            if RE_FIRST_LAST.search(link_data) and \
+                    not RE_NEXT_LINK.search(page['text']):
+                page['score'] -= 65
+            if RE_NEGATIVE.search(link_data) or \
+                    RE_EXTRANEOUS.search(link_data):
+                page['score'] -= 50
+            if RE_PREV_LINK.search(link_data):
+                page['score'] -= 200
+
+            positive = negative = False
+            parent = link.getparent()
+            while parent is not None:
+                class_and_id = parent.get('class', '') + ' ' + \
+                    parent.get('id', '')
+                if not positive and RE_PAGING.search(class_and_id):
+                    positive = True
+                    page['score'] += 25
+                # 'footer' is negative, 'body-and-footer' is left be
+                if not negative and RE_NEGATIVE.search(class_and_id) and \
+                        not RE_POSITIVE.search(class_and_id):
+                    negative = True
+                    page['score'] -= 25
+                parent = parent.getparent()
+
+            # paging in the url, e.g. /page/2/, /pagenum/2, ?p=3, ?page=11
+            if RE_PAGE_URL.search(link_href) or \
+                    RE_PAGE_WORD.search(link_href):
+                page['score'] += 25
+            if RE_EXTRANEOUS.search(link_href):
+                page['score'] -= 15
+
+            # page numbers score a little, lower ones slightly more. 1 is the
+            # page we are on or one before it.
+            match = RE_PAGE_NUMBER.match(link_text)
+            number = int(match.group(1)) if match else 0
+            if number == 1:
+                page['score'] -= 10
+            elif number:
+                page['score'] += max(0, 10 - number)
 
-    # line 1348
-    # successfulRequest - part of "next page downloading"
+        top = None
+        for page in possible.values():
+            if page['score'] >= 50 and (top is None or
+                    top['score'] < page['score']):
+                top = page
+        if top is None:
+            return None
+        if self.debug:
+            self.log('NEXT PAGE IS ' + top['href'])
+        parsed.add(top['href'])
+        return top['href']
+
+    # line 1329
+    # xhr, successfulRequest and ajax - the fetchers of 'readable.pages'
 
-    # line 1352
-    # ajax - part of "next page downloading"
-    
     # line 1396
-    # appendNextPage - part of "next page downloading"
+    # appendNextPage - see 'readable.pages.PageAssembler'
 
 
     # line 1512
     def get_class_weight(self, node):
         if not (self.flags & self.FLAG_CLASS_WEIGHT):
             return 0
-        weight = 0
+        return self._class_weight(node)
+
+
+    # extracted from 'get_class_weight'
+    def _class_weight(self, node):
+        "Return the class weight of 'node', whatever the flags."
         ncls, nid = self.get_clsid(node)
-        if ncls:
-            if RE_NEGATIVE.search(ncls):
-                weight -= 25
-            if RE_POSITIVE.search(ncls):
-                weight += 25
-        if nid:
-            if RE_NEGATIVE.search(nid):
-                weight -= 25
-            if RE_POSITIVE.search(nid):
-                weight += 25
-        return weight
+        classify = self.classifier.classify
+        return classify(ncls)[1] + classify(nid)[1]
 
 
     # line 1544
@@ -641,7 +2487,7 @@ class Readable(object):
                 vals = '|'.join(n.attrib.values())
                 if RE_VIDEOS.search(vals):
                     continue
-            n.getparent().remove(n)
+            self.remove_node(n)
 
 
     # line 1605
@@ -656,26 +2502,25 @@ class Readable(object):
             score = 0
 
             # line 1624
-            msg = 'Cleaning Conditionally ' + self.get_info(n)
-            if self.is_readable(n):
-                msg += ' with score %.2f' % n.readable.score
-            self.log(msg)
+            if self.debug:
+                msg = 'Cleaning Conditionally ' + self.get_info(n)
+                if self.is_readable(n):
+                    msg += ' with score %.2f' % self.scores[n]
+                self.log(msg)
 
             if self.is_readable(n):
-                score = n.readable.score
+                score = self.scores[n]
             if weight + score < 0:
-                n.getparent().remove(n)
+                self.remove_node(n)
             elif self.get_char_count(n, ',') < 10:
-                num_p = len(n.xpath('.//p'))
-                num_img = len(n.xpath('.//img'))
-                num_li = len(n.xpath('.//li')) - 100
-                num_input = len(n.xpath('.//input'))
-                num_embeds = 0
-                for em in n.xpath('.//embed'):
-                    if RE_VIDEOS.search(em.get('src', '')):
-                        num_embeds += 1
+                index = self.index
+                num_p = index.tag_count(n, 'p')
+                num_img = index.tag_count(n, 'img')
+                num_li = index.tag_count(n, 'li') - 100
+                num_input = index.tag_count(n, 'input')
+                num_embeds = index.video_count(n)
                 link_density = self.get_link_density(n)
-                len_content = len(self.get_inner_text(n))
+                len_content = self.get_text_length(n)
                 
                 # line 1649
                 to_remove = 0
@@ -694,7 +2539,7 @@ class Readable(object):
                 elif (num_embeds == 1 and len_content < 75) or num_embeds > 1:
                     to_remove = 1
                 if to_remove:
-                    n.getparent().remove(n)
+                    self.remove_node(n)
 
 
     # line 1680
@@ -704,7 +2549,7 @@ class Readable(object):
                 cw = self.get_class_weight(n)
                 ld = self.get_link_density(n)
                 if cw < 0 or ld > 0.33:
-                    n.getparent().remove(n)
+                    self.remove_node(n)
 
 
     # line 1698 - animation and display functions.
@@ -1,15 +1,29 @@
 
 
 # std
+import codecs
+import io
+import mmap
 import os
 import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
 import unittest
+try:
+    import pathlib
+except ImportError:
+    pathlib = None
 
 # vendor
+import lxml.etree
 import lxml.html
 
 # local
-import core
+from readable import cache
+from readable import core
 
 
 ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -30,16 +44,686 @@ def get_tree(name):
     return lxml.html.fromstring(data)
 
 
+class ListNodeIter(core.NodeIter):
+
+    """
+    The original iterator over a list of nodes, rebuilt on every step so
+    that it sees all changes made to the tree.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.idx = 0
+        self.current = None
+
+    def next(self):
+        nodes = list(self.root.iterdescendants())
+        if self.idx >= len(nodes):
+            raise StopIteration()
+        node = nodes[self.idx]
+        self.current = node
+        idx = self.idx
+        self.idx += 1
+        return idx, node
+
+    __next__ = next
+
+    def revisit(self):
+        self.idx -= 1
+
+    def remove(self):
+        self.current.getparent().remove(self.current)
+        self.idx -= 1
+
+
+class DyingReadable(core.Readable):
+
+    "Kills the worker process extracting the empty document."
+
+    def extract(self, data, output='html', **kwargs):
+        if not data:
+            os._exit(1)
+        return core.Readable.extract(self, data, output, **kwargs)
+
+
 class TestReadable(unittest.TestCase):
 
     def test_convert_brs(self):
         rb = core.Readable(debug=0)
         res = rb.convert_brs(get_tree('breaks_t.html'))
         exp = lxml.html.fromstring(get_data('breaks_e.html'))
-        res = RE_SPACE.sub('', lxml.html.tostring(res))
-        exp = RE_SPACE.sub('', lxml.html.tostring(exp))
+        res = RE_SPACE.sub('', lxml.html.tostring(res, encoding='unicode'))
+        exp = RE_SPACE.sub('', lxml.html.tostring(exp, encoding='unicode'))
+        self.assertEquals(res, exp)
+
+    def test_clean_document(self):
+        # one walk does the work of the cleaner, convert_brs and clean_styles
+        pages = [get_data('breaks_t.html'), get_data('article.html'), u"""
+            <html><head><script>x()</script></head><body onload="x()">
+            lead<!-- c --> text<br><script>y()</script>after script<br>
+            <foo class="a">unknown <b>tag</b><br>split</foo> tail
+            <p style="color: red" onclick="x()">
+            <a href=" javascript:alert(1)">js</a><a href=" /ok ">ok</a>
+            <image src="/i.png"><?php echo 1 ?><link rel="stylesheet">
+            </p><style>a { b: expression(1) } @import "x.css";</style>
+            <style type="text/javascript">z()</style>
+            <object codebase="http://a/" data="javascript:1"><param
+            name="movie" valuetype="ref" value="javascript:2"></object>
+            <div><o:p>x</o:p><br>&bogus; end</div>
+            </body></html>""", u"""<foo><!-- c --><p>fragment</p>
+            <br>text</foo>"""]
+        rb = core.Readable()
+        for data in pages:
+            tree = lxml.html.fromstring(data)
+            rb.make_cleaner()(tree)
+            body = tree.find('body')
+            if body is None:
+                body = lxml.html.Element('body')
+                for n in tree.getchildren():
+                    body.append(n)
+                tree.append(body)
+            body.attrib['id'] = 'readableBody'
+            exp = rb.convert_brs(body)
+            rb.clean_styles(exp)
+            res = rb.prep_document(data)
+            self.assertEquals(lxml.html.tostring(res, encoding='unicode'),
+                lxml.html.tostring(exp, encoding='unicode'))
+        # the cleaner fails on this one
+        res = rb.prep_document('<p><object><param valuetype="ref"></object>')
+        self.assertEquals(len(res.xpath('.//param')), 1)
+
+        for link, exp in [('/a.html', False), ('java\tscript:x()', True),
+                ('%6aavascript:x', True), ('data:image/png;base64,AA', False),
+                ('data:image/svg+xml;base64,AA', True), ('about:blank', True)]:
+            self.assertEquals(core.is_javascript_link(link), exp)
+        for style, exp in [('a { color: red }', False),
+                ('a { b: ex/**/pression(1) }', True),
+                ('a { b: url(JAVA\\SCRIPT:x) }', True),
+                ('</noscript><img src=x>', True), ('a{}', False)]:
+            self.assertEquals(core.has_sneaky_javascript(style), exp)
+
+    def test_grab_article_preps_once(self):
+        calls = []
+        class Counting(core.Readable):
+            def prep_document(self, data):
+                calls.append(data)
+                return core.Readable.prep_document(self, data)
+        class Reparsing(core.Readable):
+            def grab_article(self, data):
+                self.data = data
+                return core.Readable.grab_article(self, data)
+            def copy_document(self, body):
+                return core.Readable.prep_document(self, self.data)
+
+        data = get_data('article.html')
+        res = lxml.html.tostring(Counting().grab_article(data))
+        exp = lxml.html.tostring(Reparsing().grab_article(data))
+        self.assertEquals(len(calls), 1)
         self.assertEquals(res, exp)
 
+    def test_shared_scoring(self):
+        class Rescoring(core.Readable):
+            def grab_article(self, data):
+                self.data = data
+                return core.Readable.grab_article(self, data)
+            def copy_scored(self, scored):
+                body = core.Readable.prep_document(self, self.data)
+                return self.score_document(body)
+
+        for name in ('breaks_t.html', os.path.join('corpus', 'listing.html')):
+            data = get_data(name)
+            res = lxml.html.tostring(core.Readable().grab_article(data))
+            exp = lxml.html.tostring(Rescoring().grab_article(data))
+            self.assertEquals(res, exp)
+
+        rb = core.Readable()
+        rb.flags &= ~rb.FLAG_STRIP_UNLIKELY
+        body = rb.prep_document(get_data('article.html'))
+        scored = rb.score_document(body)
+        copy = rb.copy_scored(scored)
+        self.assertEquals(lxml.html.tostring(copy.body),
+            lxml.html.tostring(body))
+        self.assertTrue(scored.candidates)
+        self.assertEquals(len(copy.candidates), len(scored.candidates))
+        for a, b in zip(scored.candidates, copy.candidates):
+            self.assertFalse(a is b)
+            self.assertEquals(rb.get_path(a), rb.get_path(b))
+            self.assertEquals(copy.index.get(b), scored.index.get(a))
+        for name in core.ScoredTree.PARAGRAPHS + core.ScoredTree.COLUMNS:
+            self.assertEquals(getattr(copy, name), getattr(scored, name))
+
+    def test_shared_instance(self):
+        docs = [get_data('article.html'), get_data('breaks_t.html')] * 4
+        exp = [lxml.html.tostring(core.Readable().grab_article(d))
+            for d in docs]
+        rb = core.Readable()
+        flags = rb.flags
+        res = {}
+
+        def work(i):
+            res[i] = lxml.html.tostring(rb.grab_article(docs[i]))
+
+        threads = [threading.Thread(target=work, args=(i,))
+            for i in range(len(docs))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEquals([res[i] for i in range(len(docs))], exp)
+        self.assertEquals([lxml.html.tostring(rb.grab_article(d))
+            for d in docs], exp)
+        self.assertEquals(rb.flags, flags)
+        self.assertEquals(rb.scores, {})
+
+    def test_extract_many(self):
+        rb = core.Readable()
+        docs = [get_data('article.html'), '', get_data('breaks_t.html')] * 3
+        exp = [rb.extract(d, 'text') if d else None for d in docs]
+        for workers in (1, 2):
+            res = list(rb.extract_many(docs, workers=workers, chunksize=2,
+                output='text'))
+            self.assertEquals([r.index for r in res], list(range(len(docs))))
+            self.assertEquals([r.content for r in res], exp)
+            for r in res:
+                self.assertEquals(r.error is not None, r.content is None)
+                if r.error:
+                    self.assertTrue('Document is empty' in r.error)
+        res = rb.extract_many(iter(docs), workers=3, ordered=False)
+        res = sorted(res)
+        self.assertEquals([r.index for r in res], list(range(len(docs))))
+        self.assertEquals(res[0].content, rb.extract(docs[0]))
+
+        # documents that cannot be sent to a worker fail with their chunk
+        fh = open(os.path.join(ROOT, 'testdata', 'article.html'), 'rb')
+        try:
+            res = list(rb.extract_many([docs[0], fh, threading.Lock(),
+                docs[2]], workers=2, output='text'))
+        finally:
+            fh.close()
+        self.assertEquals([r.index for r in res], list(range(4)))
+        self.assertEquals([r.content for r in res],
+            [exp[0], None, None, exp[2]])
+        self.assertTrue(res[1].error)
+        self.assertTrue('pickle' in res[2].error)
+
+        if core.ProcessPoolExecutor is not None:
+            # a dying worker fails the chunks in flight, a new one takes
+            # the chunks after them
+            docs = [''] + [docs[0]] * 12
+            res = list(DyingReadable().extract_many(docs, workers=2,
+                output='text'))
+            self.assertTrue('BrokenProcessPool' in res[0].error)
+            self.assertEquals(res[-1].content, exp[0])
+            for r in res:
+                self.assertEquals(r.error is not None, r.content is None)
+
+    def test_serialize(self):
+        rb = core.Readable()
+        content = lxml.html.fromstring(u"""<div>lead <p>one,  two</p>\n
+            <p> three </p> tail<!-- c --> end<ul><li>caf\xe9</li><li>
+            \u4e2d</li></ul></div>""")
+        text = rb.serialize(content, 'text')
+        self.assertEquals(text, rb.get_inner_text(content))
+        paras = rb.serialize(content, 'paragraphs')
+        self.assertEquals([tuple(p) for p in paras], [('lead', 0, 4, 'div'),
+            ('one, two', 5, 13, 'p'), ('three', 14, 19, 'p'),
+            ('tail end', 20, 28, 'div'), (u'caf\xe9', 28, 32, 'li'),
+            (u'\u4e2d', 33, 34, 'li')])
+        for p in paras:
+            self.assertEquals(text[p.start:p.end], p.text)
+
+        html = lxml.html.tostring(content, encoding='unicode')
+        for output, encoding, exp in (('html', 'utf-8', html.encode('utf-8')),
+                ('html', 'latin-1', html.replace(u'\u4e2d', '&#20013;')
+                .encode('latin-1')), ('text', 'utf-16', text.encode('utf-16'))):
+            stream = io.BytesIO()
+            self.assertEquals(rb.serialize(content, output, stream, encoding),
+                None)
+            self.assertEquals(stream.getvalue(), exp)
+        self.assertRaises(UnicodeEncodeError, rb.serialize, content, 'text',
+            io.BytesIO(), 'ascii')
+        self.assertRaises(ValueError, rb.serialize, content, 'paragraphs',
+            io.BytesIO())
+        self.assertRaises(ValueError, rb.serialize, content, 'xml')
+
+        for data in (get_data('article.html'), get_data('breaks_t.html')):
+            text = rb.extract(data, 'text')
+            paras = rb.extract(data, 'paragraphs')
+            self.assertTrue(paras)
+            for p in paras:
+                self.assertEquals(text[p.start:p.end], p.text)
+            self.assertEquals(''.join(text.split()),
+                ''.join(''.join(p.text for p in paras).split()))
+
+    def test_budget(self):
+        class Sink(object):
+            def stage(self, name, seconds):
+                pass
+            def document(self, stats):
+                self.stats = stats
+
+        article = get_data('article.html')
+        news = get_data(os.path.join('corpus', 'news.html'))
+        full = core.Readable().extract(article, 'text')
+        sink = Sink()
+
+        def run(data, cls=core.Readable, **kwargs):
+            rb = cls(metrics=sink, budget=core.Budget(**kwargs))
+            text = rb.extract(data, 'text')
+            return (text, sink.stats.get('budgets'),
+                len(sink.stats['passes']))
+
+        # the article is found by the second pass
+        self.assertEquals(run(article), (full, None, 2))
+        self.assertEquals(run(article, max_passes=1), ('', ['passes'], 1))
+        self.assertEquals(run(article, max_passes=3, max_seconds=60),
+            (full, None, 2))
+        # budgets not reached by a page done in one pass are not reported
+        self.assertEquals(run(news, max_passes=1)[1:], (None, 1))
+
+        # out of time once prepped, or out of passes before the first one,
+        # the whole body is returned
+        body = core.Readable().prep_document(article)
+        self.assertEquals(run(article, max_seconds=0),
+            (core.Readable().get_inner_text(body), ['seconds'], 0))
+        self.assertEquals(run(article, max_passes=0),
+            (core.Readable().get_inner_text(body), ['passes'], 0))
+
+        # the budgets that ran out come with the article
+        rb = core.Readable(budget=core.Budget(max_bytes=2000, max_passes=1))
+        self.assertEquals(rb.grab(news).budgets, ('bytes',))
+        self.assertEquals(rb.extract_article(article, 'text').budgets,
+            ('bytes', 'passes'))
+        self.assertEquals(core.Readable().grab(news).budgets, ())
+        cached = core.Readable(cache=cache.MemoryCache(),
+            budget=core.Budget(max_passes=1))
+        for i in range(2):
+            self.assertEquals(cached.extract_article(article).budgets,
+                ('passes',))
+
+        # out of time within a pass, while selecting nodes to score
+        class Slow(core.Readable):
+            def is_unlikely(self, node):
+                if not self.slept:
+                    self.slept = True
+                    time.sleep(0.05)
+                return core.Readable.is_unlikely(self, node)
+        Slow.slept = False
+        page = '<div>%s</div>' % ('<p>Some text, in a paragraph.</p>' * 300)
+        text, spent, num = run(page, Slow, max_seconds=0.01)
+        self.assertEquals((spent, num), (['seconds'], 1))
+        self.assertEquals(text, core.Readable().get_inner_text(
+            core.Readable().prep_document(page)))
+
+        # or before cleaning the content found
+        class Late(core.Readable):
+            def score_nodes(self, nodes, body):
+                time.sleep(0.05)
+                return core.Readable.score_nodes(self, nodes, body)
+            def prep_article(self, content):
+                raise AssertionError('cleaned')
+        text, spent, num = run(news, Late, max_seconds=0.01)
+        self.assertEquals((spent, num), (['seconds'], 1))
+        self.assertTrue(len(text) > 250)
+
+        text, spent, num = run(news, max_bytes=2000)
+        self.assertEquals(text, core.Readable().extract(news[:2000], 'text'))
+        self.assertEquals(spent, ['bytes'])
+        self.assertEquals(sink.stats['bytes'], len(news))
+        text, spent, num = run(news, max_nodes=30)
+        self.assertTrue(text and len(text) < 250)
+        self.assertEquals((spent, num), (['nodes'], 4))
+
+        rb = core.Readable()
+        tree = lxml.html.fromstring('<div><p>a<b>b</b>c</p>d<ul><li>e</li>'
+            '<li>f</li></ul>g<p>h</p></div>')
+        self.assertFalse(rb.truncate_document(tree, 7))
+        self.assertTrue(rb.truncate_document(tree, 4))
+        self.assertEquals(lxml.html.tostring(tree, encoding='unicode'),
+            '<div><p>a<b>b</b>c</p>d<ul><li>e</li></ul>g</div>')
+        self.assertTrue(rb.truncate_document(tree, 0))
+        self.assertEquals(len(tree), 0)
+
+    def test_inputs(self):
+        rb = core.Readable()
+        data = get_data(os.path.join('corpus', 'news.html'))
+        exp = rb.extract(data)
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'news.html')
+            fh = open(path, 'wb')
+            fh.write(data)
+            fh.close()
+            fh = open(path, 'rb')
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            inputs = [io.BytesIO(data), open(path, 'rb'), mapped,
+                io.open(path, 'rb')]
+            if pathlib is not None:
+                inputs.append(pathlib.Path(path))
+            for source in inputs:
+                self.assertEquals(rb.extract(source), exp)
+            # a file is read from where it stands
+            fh.seek(5)
+            self.assertEquals(rb.extract(fh), rb.extract(data[5:]))
+            self.assertEquals(rb.cache_key(mapped, 'html'),
+                rb.cache_key(data, 'html'))
+            budget = core.Budget(max_bytes=2000)
+            self.assertEquals(core.Readable(budget=budget).extract(mapped),
+                core.Readable(budget=budget).extract(data))
+            mapped.close()
+            fh.close()
+            for source in inputs[1::2]:
+                source.close()
+        finally:
+            shutil.rmtree(tmp)
+
+        # a pipe cannot seek, and is read
+        r, w = os.pipe()
+        source = os.fdopen(r, 'rb')
+        sink = os.fdopen(w, 'wb')
+        writer = threading.Thread(target=lambda: (sink.write(data),
+            sink.close()))
+        writer.start()
+        try:
+            self.assertEquals(rb.extract(source), exp)
+        finally:
+            writer.join()
+            source.close()
+
+        # a tar member is read, not the whole archive it is a part of
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'pages.tar')
+            tar = tarfile.open(path, 'w')
+            for name in ('a.html', 'b.html'):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+            tar.close()
+            tar = tarfile.open(path)
+            for name in ('a.html', 'b.html'):
+                self.assertEquals(rb.extract(tar.extractfile(name)), exp)
+            tar.close()
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEquals(rb.extract(io.BufferedReader(io.BytesIO(data))),
+            exp)
+
+        # the declared charset is found once, wherever it is declared
+        text = (u'<html><head><title>\u0442\u0435</title>%s</head><body><p>'
+            u'\u043f\u0440\u0438\u0432\u0435\u0442, \u2116 5</p></body>'
+            u'</html>')
+        exp = rb.extract(text % u'', 'text')
+        meta = u'<meta charset="%s">'
+        for data in (codecs.BOM_UTF8 + (text % u'').encode('utf-8'),
+                codecs.BOM_UTF16_LE + (text % meta % 'utf-8')
+                    .encode('utf-16-le'),
+                (text % meta % 'utf-8').encode('utf-8'),
+                (text % meta % 'windows-1251').encode('cp1251'),
+                (text % meta % 'utf-16').encode('utf-8'),
+                (u'<?xml version="1.0" encoding="iso-8859-5"?>' +
+                    text % u'').encode('iso-8859-5')):
+            self.assertEquals(rb.extract(data, 'text'), exp)
+            self.assertEquals(rb.extract(io.BytesIO(data), 'text'), exp)
+        self.assertEquals(rb.sniff_encoding(b'<p>a</p>'), (None, 0))
+        self.assertEquals(rb.sniff_encoding(b'<meta charset=x-bogus>'),
+            (None, 0))
+        self.assertRaises(lxml.etree.ParserError, rb.extract, io.BytesIO())
+
+    def test_metadata(self):
+        rb = core.Readable()
+        news = get_data(os.path.join('corpus', 'news.html'))
+        res = rb.grab(news)
+        self.assertEquals(lxml.html.tostring(res.content),
+            lxml.html.tostring(rb.grab_article(news)))
+        self.assertEquals(res[1:], ('City council approves new tram line '
+            'after decade of debate', 'ltr',
+            'https://courier.example.com/news/2012/05/tram-line',
+            'The council voted 31-12 to fund the eastern tram extension.',
+            None, ()))
+        res = rb.grab(get_data(os.path.join('corpus', 'blog_comments.html')))
+        self.assertEquals(res.published, '2011-09-02T08:00:00Z')
+
+        page = (u'<html><head><title>%s</title><link rel="Canonical" '
+            u'href="../b"><meta property="og:url" content="/c"><meta '
+            u'name="Description" content=" one "><meta name="og:description" '
+            u'content="two"></head><body><h1>The only heading of the page'
+            u'</h1><p>text</p></body></html>')
+        res = rb.grab(page % u'Short', url='http://example.com/x/a')
+        self.assertEquals(res[1:], ('The only heading of the page', 'ltr',
+            'http://example.com/b', 'one', None, ()))
+        long_title = 'A long article title here'
+        for title, exp in [
+                (u'%s | Site' % long_title, long_title),
+                (u'Site | %s' % long_title, long_title),
+                (u'News - Site', 'News - Site'),
+                (u'Site: %s' % long_title, long_title),
+                (u'Site: %s: more' % long_title, long_title + ': more'),
+                (u'  A   long title  without a separator ',
+                    'A long title without a separator'),
+                (u'\u05d0\u05d1\u05d2 \u05d3\u05d4\u05d5 - \u05d6\u05d7 '
+                    u'\u05d8\u05d9 \u05db\u05dc', None)]:
+            res = rb.grab(page % title)
+            if exp is not None:
+                self.assertEquals(res.title, exp)
+            else:
+                self.assertEquals(res.direction, 'rtl')
+        self.assertEquals(rb.get_suggested_direction(u''), 'ltr')
+        self.assertEquals(rb.get_suggested_direction(
+            u'@\u05d0\u05d1 abcdefghij'), 'ltr')
+        # the share is of the text left once the handle is dropped
+        self.assertEquals(rb.get_suggested_direction(
+            u'@abcdefghij \u05d0\u05d1'), 'rtl')
+        self.assertEquals(rb.get_suggested_direction(u'@abc'), 'ltr')
+
+        store = cache.MemoryCache()
+        cached = core.Readable(cache=store)
+        for output in core.OUTPUTS:
+            exp = rb.extract_article(news, output)
+            self.assertEquals(exp.content, rb.extract(news, output))
+            for i in range(2):
+                self.assertEquals(cached.extract_article(news, output), exp)
+        self.assertEquals(store.stats()['hits'], len(core.OUTPUTS))
+        # the url a cached page was fetched from is not part of the key
+        page = page % u'Short'
+        for url, exp in [('http://a.com/x/y', 'http://a.com/b'),
+                ('http://b.com/z/w', 'http://b.com/b'), (None, '../b')]:
+            self.assertEquals(cached.extract_article(page, url=url).canonical,
+                exp)
+        self.assertEquals(store.stats()['hits'], len(core.OUTPUTS) + 2)
+
+    def test_next_page_link(self):
+        rb = core.Readable()
+        for url, exp in [
+                ('http://example.com/news/story/2', '/news/story'),
+                ('http://example.com/news/story-p3.html', '/news/story'),
+                ('http://example.com/news/story/index.html', '/news/story'),
+                ('http://example.com/news/page/12/', '/news/page'),
+                ('http://www.ew.com/ew/article/0,,20313460_20369436,00.html',
+                    '/ew/article/0,,20313460_20369436')]:
+            self.assertEquals(rb.find_base_url(url),
+                url[:url.index('/', 8)] + exp)
+
+        page = lxml.html.fromstring(u'<div><div class="pagination">'
+            u'<a href="/story">1</a> <a href="/story/2">2</a> '
+            u'<a href="/story/3">3</a> <a href="/story/2#top">Next \xbb</a> '
+            u'<a href="/story/3">Last \xbb|</a></div><div id="footer">'
+            u'<a href="/story/print/2">Print</a> <a href="/archive/2">'
+            u'Older</a> <a href="http://other.example.com/story/2">Next</a>'
+            u'</div></div>')
+        parsed = set(['http://example.com/story'])
+        self.assertEquals(rb.find_next_page_link(page,
+            'http://example.com/story', parsed), 'http://example.com/story/2')
+        self.assertTrue('http://example.com/story/2' in parsed)
+        # the pages parsed are not offered again, nor the links before them
+        self.assertEquals(rb.find_next_page_link(page,
+            'http://example.com/story/2', parsed), None)
+        parsed = set()
+        self.assertEquals(rb.find_next_page_link(page,
+            'http://example.com/story/2', parsed), None)
+        self.assertEquals(rb.find_next_page_link(lxml.html.fromstring(
+            u'<div><a href="/story/3" class="next">3</a></div>'),
+            'http://example.com/story/2', parsed), 'http://example.com/story/3')
+
+    def test_node_iter(self):
+        nested = """
+            <div class="comment"><div class="sidebar">x</div>y</div>
+            <div>text <b>bold</b>, tail<div>inner <i>text</i> and more
+            text, padded out to score.</div> tail</div>
+            <div><div><div class="ad-break"><p>gone</p></div></div></div>
+            <table><tr><td>cell <div>no blocks, just text to score.</div>
+            </td></tr></table>
+            """
+
+        def run(cls, data):
+            orig = core.NodeIter
+            core.NodeIter = cls
+            try:
+                rb = core.Readable()
+                body = rb.prep_document(data)
+                to_score = rb.select_scorable(body)
+                paths = [rb.get_path(n) for n in to_score]
+                content = rb.score_paras(to_score, body)
+                return paths, lxml.html.tostring(content)
+            finally:
+                core.NodeIter = orig
+
+        for data in (get_data('article.html'), nested):
+            self.assertEquals(run(core.NodeIter, data),
+                run(ListNodeIter, data))
+
+
+    def test_rewrites_in_place(self):
+        rb = core.Readable()
+        body = rb.prep_document('<div id="a">only text</div><div id="b">'
+            'lead <b>bold</b> tail<div>inner</div>end</div>')
+        a, b = body
+        bold = b[0]
+        to_score = rb.select_scorable(body)
+        # a revisited <div> turned <p> is scored twice, as before
+        self.assertEquals(to_score[:2], [a, a])
+        self.assertEquals(a.tag, 'p')
+        self.assertTrue(body[1] is b and b[1] is bold)
+        self.assertEquals([(n.tag, n.text) for n in b], [('p', 'lead '),
+            ('b', 'bold'), ('p', ' tail'), ('p', 'inner'), ('p', 'end')])
+
+        # siblings of the top candidate are retagged as they are appended,
+        # the class of 'top' still counting for the siblings after it
+        body = lxml.html.fromstring('<div><blockquote class="x">%s'
+            '</blockquote><blockquote class="x">%s</blockquote><ul class="y">'
+            '<li>%s</li></ul></div>' % (('long enough text, ' * 3,) * 3))
+        first, second, third = body
+        rb.reset()
+        rb.flags &= ~rb.FLAG_CLEAN_CONDITIONALLY
+        rb.scores.update({first: 100, second: 15, third: 5})
+        content = rb._select_top([first, second, third], body)
+        self.assertEquals(list(content), [first, second])
+        self.assertEquals([(n.tag, n.get('class')) for n in content],
+            [('div', ''), ('div', '')])
+        self.assertFalse(rb.is_readable(first) or rb.is_readable(second))
+        self.assertEquals(third.getparent(), body)
+
+    def test_deep_nesting(self):
+        # far deeper than the recursion limit, and than the parser allows
+        depth = 10000
+
+        def build():
+            html = lxml.html.Element('html')
+            body = lxml.etree.SubElement(html, 'body')
+            node = body
+            for i in range(depth):
+                node = lxml.etree.SubElement(node, ('div', 'span')[i % 2],
+                    style='color: red')
+            node.text = 'lead text, ' * 30
+            br = lxml.etree.SubElement(node, 'br')
+            br.tail = 'after the break, ' * 30
+            return body, node
+
+        rb = core.Readable()
+        body, leaf = build()
+        path = rb.get_path(leaf).split(' / ')
+        self.assertEquals(len(path), depth + 2)
+        self.assertEquals(path[:3], ['html', 'body (:)', 'div (:)'])
+        copy = rb.node_copy(body)
+        self.assertEquals([(n.tag, n.attrib, n.text) for n in copy.iter()],
+            [(n.tag, n.attrib, n.text) for n in body.iter()])
+        rb.clean_styles(body)
+        self.assertFalse([n for n in body.iter() if 'style' in n.attrib])
+        self.assertTrue(rb.convert_brs(body) is body)
+        self.assertEquals([n.tag for n in leaf], ['p', 'p'])
+        self.assertEquals(leaf[1].text, 'after the break, ' * 30)
+
+        body, leaf = build()
+        rb.clean_document(body)
+        content = rb.score_paras(rb.select_scorable(body), body)
+        self.assertTrue(content.text_content().startswith('lead text'))
+
+    def test_score_table(self):
+        rb = core.Readable()
+        body = rb.prep_document(get_data('article.html'))
+        rb.flags &= ~rb.FLAG_STRIP_UNLIKELY
+        content = rb.score_paras(rb.select_scorable(body), body)
+        top = content[0]
+        self.assertTrue(rb.is_readable(top))
+        self.assertFalse(hasattr(top, 'readable'))
+        self.assertEquals(max(rb.scores.values()), rb.scores[top])
+
+    def test_node_index(self):
+        rb = core.Readable()
+        tree = lxml.html.fromstring(u"""
+            <div> lead,  text <!-- skipped, --> <p>one,\xa0two <a> link
+            <b>bold</b></a>\t</p>\n\n<a>  <a>nested, </a> </a>
+            <div class="x">  \xa0 </div><span>a,b</span>c
+            <p><img> </p>trailing , text <ul><li><p>x</p><input></li><li>
+            <embed src="http://www.youtube.com/v/1"><embed src="/a"><object>
+            </object></li></ul></div>""")
+        nodes = [n for n in tree.iter() if n.tag not in core.NON_ELEMENTS]
+
+        def check():
+            for n in nodes:
+                text = rb.get_inner_text(n)
+                links = sum(len(rb.get_inner_text(a)) for a in n.xpath('.//a'))
+                self.assertEquals(rb.get_text_length(n), len(text))
+                self.assertEquals(rb.get_char_count(n, ','), text.count(','))
+                self.assertEquals(rb.index.link_length(n), links)
+                self.assertEquals(rb.index.has_text(n),
+                    bool(rb.get_inner_text(n, 0)))
+                for tag in core.INDEX_TAGS:
+                    self.assertEquals(rb.index.tag_count(n, tag),
+                        len(n.xpath('.//%s' % tag)))
+                videos = [e for e in n.xpath('.//embed')
+                    if core.RE_VIDEOS.search(e.get('src', ''))]
+                self.assertEquals(rb.index.video_count(n), len(videos))
+
+        check()
+        for tag in ('b', 'span', 'img', 'a', 'embed', 'li'):
+            rb.index.remove(tree.xpath('.//%s' % tag)[0])
+            check()
+
+    def test_classifier(self):
+        values = ['', 'post-content entry', 'sidebar', 'main-sidebar',
+            'com-nav', 'ad-break', 'footer', 'article-body', 'Comment',
+            'tags widget', 'page hentry', 'shoutbox', 'plain']
+        clf = core.Classifier(size=4)
+        for value in values * 2:
+            weight = 0
+            if core.RE_NEGATIVE.search(value):
+                weight -= 25
+            if core.RE_POSITIVE.search(value):
+                weight += 25
+            unlikely = bool(core.RE_UNLIKELY.search(value) and
+                not core.RE_MAYBE.search(value))
+            self.assertEquals(clf.classify(value), (unlikely, weight))
+        self.assertEquals(len(clf.cache), 4)
+        self.assertEquals(list(clf.cache), values[-4:])
+        # a hit moves the value to the end, away from eviction
+        clf.classify(values[-4])
+        clf.classify('new')
+        self.assertEquals(list(clf.cache), values[-2:] + [values[-4], 'new'])
+        self.assertEquals(clf.hits, 1)
+        clf.clear()
+        self.assertEquals((len(clf.cache), clf.hits, clf.misses), (0, 0, 0))
+
 
 def main():
     unittest.main()
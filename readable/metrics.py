@@ -0,0 +1,280 @@
+"""
+readable extraction metrics.
+
+A Readable built with a metrics sink reports to it as it goes:
+
+    metrics = Metrics()
+    readable = Readable(metrics=metrics)
+    readable.extract(page)
+    sys.stdout.write(metrics.to_prometheus())
+
+Any object with the two methods below can be used as a sink:
+
+  stage(name, seconds)
+        called after each run of an extraction stage: 'prep_document',
+        'copy_document', 'copy_scored', 'select_scorable', 'score_nodes',
+        'score_paras' and 'prep_article'. Stage times include the stages
+        they call.
+
+  document(stats)
+        called once per document with a dict of 'bytes', 'seconds' and
+        'passes', a list with one dict per extraction pass that was run,
+        holding its 'flags', the number of 'candidates' scored, of
+        'unlikely' nodes stripped and of nodes 'removed' while cleaning the
+        content, and the 'text_length' of the content it found. When a site
+        profile was tried, 'profile' is 'hit' if it was used and 'fallback'
+        if the full extraction was run after all, in which case 'passes'
+        only lists the passes of the full extraction. 'budgets' lists the
+        names of the budgets that ran out, if any: 'bytes', 'nodes',
+        'passes' or 'seconds'.
+
+Without a sink no timing is done and no statistics are gathered.
+
+Metrics collects these into counters and histograms. Passes are labelled by
+number: pass 0 runs with all flags set, pass 1 without FLAG_STRIP_UNLIKELY,
+pass 2 also without FLAG_CLASS_WEIGHT and pass 3 also without
+FLAG_CLEAN_CONDITIONALLY. A document moves on to the next pass when the text
+found is shorter than 250 characters, which is counted by
+'readable_short_passes_total'.
+"""
+
+# std
+import json
+import threading
+
+
+STAGE_SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+    2.5, 5, 10)
+
+# name, bucket upper bounds
+BUCKETS = {
+    'stage_seconds': STAGE_SECONDS,
+    'document_seconds': STAGE_SECONDS,
+    'document_bytes': (1000, 10000, 50000, 100000, 500000, 1000000, 5000000),
+    'passes': (1, 2, 3, 4),
+    'candidates': (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    'removed_nodes': (0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+    'text_length': (0, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000),
+    }
+
+HELP = {
+    'documents_total': 'Documents extracted.',
+    'passes_total': 'Extraction passes run, by pass.',
+    'short_passes_total': 'Passes that found less than 250 characters of '
+        'text, by pass.',
+    'candidates_total': 'Candidate nodes scored.',
+    'unlikely_removed_total': 'Nodes stripped as unlikely candidates.',
+    'removed_nodes_total': 'Nodes removed while cleaning the content.',
+    'profile_hits_total': 'Documents extracted with a site profile.',
+    'profile_fallbacks_total': 'Documents whose site profile failed, '
+        'extracted in full.',
+    'budget_exhausted_total': 'Documents cut short by a budget, by budget.',
+    'stage_seconds': 'Time spent per run of an extraction stage.',
+    'document_seconds': 'Time spent extracting a document.',
+    'document_bytes': 'Size of the extracted documents.',
+    'passes': 'Extraction passes needed per document.',
+    'candidates': 'Candidate nodes scored per document, over all passes.',
+    'removed_nodes': 'Nodes removed per document while cleaning the content, '
+        'over all passes.',
+    'text_length': 'Length of the text extracted per document.',
+    }
+
+# extraction passes stop once this much text is found
+MIN_TEXT_LENGTH = 250
+
+
+def _number(value):
+    "Format 'value' for the Prometheus text format."
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return '%d' % value
+
+
+def _labels(labels, extra=()):
+    "Format a sequence of (name, value) pairs as a Prometheus label set."
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, value.replace('\\', '\\\\')
+        .replace('"', '\\"').replace('\n', '\\n')) for name, value in pairs)
+
+
+class Metrics(object):
+
+    """
+    A thread safe metrics sink keeping counters and per-document histograms,
+    which can be exported in the Prometheus text format or as JSON. Metric
+    names are prefixed with 'prefix'. 'buckets' overrides the bucket upper
+    bounds of the histograms named in it.
+    """
+
+    def __init__(self, prefix='readable', buckets=None):
+        self.prefix = prefix
+        self.buckets = dict(BUCKETS)
+        if buckets:
+            self.buckets.update(buckets)
+        self.lock = threading.Lock()
+        self.clear()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def clear(self):
+        "Reset all counters and histograms."
+        # (name, labels) -> value
+        self.counters = {}
+        # (name, labels) -> [count per bucket, +Inf included], sum
+        self.histograms = {}
+
+    def stage(self, name, seconds):
+        "Record a run of the extraction stage 'name'."
+        with self.lock:
+            self._observe('stage_seconds', seconds, (('stage', name),))
+
+    def document(self, stats):
+        "Record the statistics of an extracted document."
+        passes = stats['passes']
+        candidates = 0
+        removed = 0
+        profile = stats.get('profile')
+        with self.lock:
+            self._incr('documents_total')
+            if profile == 'hit':
+                self._incr('profile_hits_total')
+            elif profile == 'fallback':
+                self._incr('profile_fallbacks_total')
+            for name in stats.get('budgets', ()):
+                self._incr('budget_exhausted_total', 1, (('budget', name),))
+            for num, rec in enumerate(passes):
+                label = (('pass', str(num)),)
+                self._incr('passes_total', 1, label)
+                if rec['text_length'] < MIN_TEXT_LENGTH:
+                    self._incr('short_passes_total', 1, label)
+                self._incr('candidates_total', rec['candidates'])
+                self._incr('unlikely_removed_total', rec['unlikely'])
+                self._incr('removed_nodes_total', rec['removed'])
+                candidates += rec['candidates']
+                removed += rec['removed']
+            self._observe('passes', len(passes))
+            self._observe('candidates', candidates)
+            self._observe('removed_nodes', removed)
+            if passes:
+                self._observe('text_length', passes[-1]['text_length'])
+            self._observe('document_seconds', stats['seconds'])
+            self._observe('document_bytes', stats['bytes'])
+
+    def _incr(self, name, value=1, labels=()):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, name, value, labels=()):
+        key = (name, labels)
+        buckets = self.buckets[name]
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = [[0] * (len(buckets) + 1), 0]
+        counts = hist[0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        hist[1] += value
+
+    def as_dict(self):
+        """
+        Return all metrics as a dict of 'counters' and 'histograms', lists
+        of dicts with the 'name' and 'labels' of each metric. Histogram
+        buckets are [upper bound, cumulative count] pairs, the last bound
+        being '+Inf'.
+        """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, ([n for n in hist[0]], hist[1]))
+                for key, hist in self.histograms.items())
+        out = {'counters': [], 'histograms': []}
+        for (name, labels), value in counters:
+            out['counters'].append({'name': self.prefix + '_' + name,
+                'labels': dict(labels), 'value': value})
+        for (name, labels), (counts, total) in histograms:
+            bounds = list(self.buckets[name]) + ['+Inf']
+            cumulative = 0
+            buckets = []
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                buckets.append([bound, cumulative])
+            out['histograms'].append({'name': self.prefix + '_' + name,
+                'labels': dict(labels), 'buckets': buckets, 'sum': total,
+                'count': cumulative})
+        return out
+
+    def to_json(self, **kwargs):
+        "Return all metrics as described in 'as_dict', encoded as JSON."
+        return json.dumps(self.as_dict(), sort_keys=True, **kwargs)
+
+    def to_prometheus(self):
+        "Return all metrics in the Prometheus text exposition format."
+        data = self.as_dict()
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name in seen:
+                return
+            seen.add(name)
+            short = name[len(self.prefix) + 1:]
+            if short in HELP:
+                lines.append('# HELP %s %s' % (name, HELP[short]))
+            lines.append('# TYPE %s %s' % (name, kind))
+
+        for rec in data['counters']:
+            header(rec['name'], 'counter')
+            lines.append('%s%s %s' % (rec['name'],
+                _labels(sorted(rec['labels'].items())), _number(rec['value'])))
+        for rec in data['histograms']:
+            name = rec['name']
+            header(name, 'histogram')
+            labels = sorted(rec['labels'].items())
+            for bound, count in rec['buckets']:
+                if bound == '+Inf':
+                    bound = float('inf')
+                lines.append('%s_bucket%s %d' % (name,
+                    _labels(labels, [('le', _number(bound))]), count))
+            lines.append('%s_sum%s %s' % (name, _labels(labels),
+                _number(rec['sum'])))
+            lines.append('%s_count%s %d' % (name, _labels(labels),
+                rec['count']))
+        return ''.join(line + '\n' for line in lines)
+
+    def drain(self):
+        """
+        Return the raw metrics collected so far and clear them, for merging
+        into another Metrics with 'merge'.
+        """
+        with self.lock:
+            state = (self.counters, self.histograms)
+            self.clear()
+        return state
+
+    def merge(self, state):
+        "Add the metrics returned by 'drain' to this instance's."
+        counters, histograms = state
+        with self.lock:
+            for (name, labels), value in counters.items():
+                self._incr(name, value, labels)
+            for key, (counts, total) in histograms.items():
+                hist = self.histograms.get(key)
+                if hist is None:
+                    hist = self.histograms[key] = [[0] * len(counts), 0]
+                for i, count in enumerate(counts):
+                    hist[0][i] += count
+                hist[1] += total
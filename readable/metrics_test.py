@@ -0,0 +1,135 @@
+
+
+# std
+import json
+import os
+import unittest
+
+# local
+from readable import core
+from readable import metrics
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_data(name):
+    path = os.path.join(ROOT, 'testdata', name)
+    fh = open(path, 'rb')
+    data = fh.read()
+    fh.close()
+    return data
+
+
+class Sink(object):
+
+    def __init__(self):
+        self.stages = []
+        self.documents = []
+
+    def stage(self, name, seconds):
+        self.stages.append(name)
+
+    def document(self, stats):
+        self.documents.append(stats)
+
+
+class QuietReadable(core.Readable):
+
+    def get_info(self, node):
+        raise AssertionError('log message built with debugging off')
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_hooks(self):
+        article = get_data('article.html')
+        sink = Sink()
+        rb = core.Readable(metrics=sink)
+        self.assertEquals(rb.extract(article), core.Readable().extract(article))
+        # the article is only found once unlikely candidates are kept, the
+        # tree kept for the later passes is scored once and copied
+        self.assertEquals(sink.stages, ['prep_document', 'copy_document',
+            'select_scorable', 'score_nodes', 'prep_article',
+            'select_scorable', 'score_nodes', 'copy_scored', 'prep_article'])
+        doc, = sink.documents
+        self.assertEquals(doc['bytes'], len(article))
+        passes = doc['passes']
+        self.assertEquals([p['flags'] for p in passes], [0xFFFF,
+            0xFFFF & ~core.Readable.FLAG_STRIP_UNLIKELY])
+        self.assertTrue(passes[0]['unlikely'] > 0)
+        self.assertEquals(passes[1]['unlikely'], 0)
+        self.assertTrue(passes[0]['text_length'] < 250)
+        self.assertTrue(passes[1]['text_length'] >= 250)
+        self.assertTrue(passes[1]['candidates'] > 0)
+
+    def test_disabled(self):
+        # no log message is formatted unless debugging
+        article = get_data('article.html')
+        rb = QuietReadable()
+        self.assertEquals(rb.extract(article), core.Readable().extract(article))
+        self.assertRaises(AssertionError, QuietReadable(debug=1).extract,
+            article)
+
+    def test_export(self):
+        article = get_data('article.html')
+        sink = metrics.Metrics()
+        rb = core.Readable(metrics=sink)
+        rb.extract(article)
+        rb.extract(article)
+        data = json.loads(sink.to_json())
+        counters = dict(((c['name'], tuple(sorted(c['labels'].items()))),
+            c['value']) for c in data['counters'])
+        self.assertEquals(counters[('readable_documents_total', ())], 2)
+        for num in range(2):
+            self.assertEquals(counters[('readable_passes_total',
+                (('pass', str(num)),))], 2)
+        self.assertEquals(counters[('readable_short_passes_total',
+            (('pass', '0'),))], 2)
+        self.assertFalse(('readable_short_passes_total', (('pass', '1'),))
+            in counters)
+        hists = dict((h['name'], h) for h in data['histograms']
+            if not h['labels'])
+        self.assertEquals(hists['readable_passes']['buckets'],
+            [[1, 0], [2, 2], [3, 2], [4, 2], ['+Inf', 2]])
+        self.assertEquals(hists['readable_passes']['sum'], 4)
+
+        text = sink.to_prometheus()
+        lines = text.splitlines()
+        self.assertTrue('# TYPE readable_documents_total counter' in lines)
+        self.assertTrue('readable_documents_total 2' in lines)
+        self.assertTrue('readable_passes_total{pass="0"} 2' in lines)
+        self.assertTrue('# TYPE readable_stage_seconds histogram' in lines)
+        self.assertTrue('readable_stage_seconds_count{stage="score_nodes"} 4'
+            in lines)
+        self.assertTrue('readable_stage_seconds_bucket{stage="score_nodes",'
+            'le="+Inf"} 4' in lines)
+        self.assertTrue('readable_passes_bucket{le="2"} 2' in lines)
+        self.assertEquals(len([l for l in lines
+            if l == '# TYPE readable_passes_total counter']), 1)
+
+        merged = metrics.Metrics()
+        merged.merge(sink.drain())
+        merged.merge(sink.drain())
+        self.assertEquals(json.loads(merged.to_json()), data)
+        self.assertEquals(sink.as_dict(), {'counters': [], 'histograms': []})
+
+    def test_extract_many(self):
+        article = get_data('article.html')
+        sink = metrics.Metrics()
+        rb = core.Readable(metrics=sink)
+        rb.extract(article)
+        res = list(rb.extract_many([article] * 4, workers=2))
+        self.assertEquals(len(res), 4)
+        data = sink.as_dict()
+        counters = dict((c['name'], c['value']) for c in data['counters']
+            if not c['labels'])
+        self.assertEquals(counters['readable_documents_total'], 5)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+"""
+readable multi-page articles.
+
+Articles split over several pages link each page to the next. A
+PageAssembler follows those links as readability's 'appendNextPage' does,
+finding each one by 'Readable.find_next_page_link', and joins the content
+of all the pages:
+
+    assembler = PageAssembler(Readable(), HTTPFetcher())
+    assembly = assembler.assemble(page, url)
+    content = assembly.article.content
+
+The link to the next page is looked for as soon as a page is prepped, and
+the next page is fetched while the page before it is still being extracted.
+Pages are extracted on a pool of 'workers' threads, and 'assemble_many'
+assembles several articles at once, their pages fetched side by side over
+the pooled connections of the fetcher.
+
+Any object with the method below can be used as a fetcher:
+
+  fetch(url)
+        return the page at 'url' as unicode or bytes, or None when it
+        cannot be fetched.
+
+DictFetcher serves pages from a dict, in process. HTTPFetcher fetches them
+over keep-alive connections shared by all threads.
+"""
+
+# std
+import collections
+import re
+import threading
+import traceback
+from multiprocessing.pool import ThreadPool
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from urllib.parse import urljoin, urlsplit
+except ImportError:
+    from urlparse import urljoin, urlsplit
+
+# vendor
+import lxml.etree
+import lxml.html
+
+# local
+from readable.core import __version__
+
+
+CONNECTIONS = {'http': httplib.HTTPConnection,
+    'https': httplib.HTTPSConnection}
+REDIRECTS = frozenset([301, 302, 303, 307, 308])
+RE_CONTENT_CHARSET = re.compile(r'charset\s*=\s*["\']?([-\w.:]+)', re.I)
+
+# text of a first paragraph long enough to tell a page repeats another
+MIN_REPEAT_LENGTH = 100
+# text of the shortest paragraph dropped when repeated on a later page
+MIN_PARAGRAPH_LENGTH = 25
+
+
+class Assembly(collections.namedtuple('Assembly', 'article urls dropped')):
+
+    """
+    The result of 'PageAssembler.assemble'. 'article' is the Article of the
+    first page, its content joining the content of the pages of 'urls', in
+    order. 'dropped' lists a (url, reason) pair for each page left out:
+    'duplicate' for a page repeating an earlier one, 'not fetched', or the
+    formatted traceback of the error that stopped it.
+    """
+
+    __slots__ = ()
+
+
+class DictFetcher(object):
+
+    """
+    A fetcher serving the pages of the dict 'pages', keyed by url, without
+    any network access. The urls asked for are listed in 'fetched'.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.fetched = []
+
+    def fetch(self, url):
+        self.fetched.append(url)
+        return self.pages.get(url)
+
+
+class HTTPFetcher(object):
+
+    """
+    A thread safe fetcher of http and https urls. Up to 'connections' idle
+    keep-alive connections to each host are kept for the next requests to
+    it, and 'opened' counts the connections made. Redirects are followed up
+    to 'redirects' times. A page is returned as unicode when the response
+    declares a charset, and as bytes otherwise, leaving the charset to be
+    found in the page. Errors, responses other than 200 OK and bodies over
+    'max_bytes' give None.
+    """
+
+    def __init__(self, timeout=10, connections=4, redirects=5,
+            max_bytes=16 * 1024 * 1024, headers=None):
+        self.timeout = timeout
+        self.connections = connections
+        self.redirects = redirects
+        self.max_bytes = max_bytes
+        self.headers = {'User-Agent': 'readable/' + __version__,
+            'Accept-Encoding': 'identity'}
+        if headers:
+            self.headers.update(headers)
+        self.lock = threading.Lock()
+        # idle connections by (scheme, host)
+        self.idle = {}
+        self.opened = 0
+
+    def fetch(self, url):
+        for i in range(self.redirects + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in CONNECTIONS:
+                return None
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            response = self.request((parts.scheme, parts.netloc), path)
+            if response is None:
+                return None
+            status, location, charset, body = response
+            if status in REDIRECTS and location:
+                url = urljoin(url, location)
+                continue
+            if status != 200 or body is None:
+                return None
+            if charset is not None:
+                try:
+                    return body.decode(charset)
+                except (LookupError, UnicodeDecodeError):
+                    pass
+            return body
+        return None
+
+    def request(self, key, path):
+        """
+        GET 'path' from the host of 'key' over a pooled connection, and
+        return the status, Location header, declared charset and body of the
+        response, or None when the request fails. A connection closed by the
+        server while idle is replaced once.
+        """
+        while True:
+            conn, reused = self._acquire(key)
+            try:
+                conn.request('GET', path, headers=self.headers)
+                response = conn.getresponse()
+                body = response.read(self.max_bytes + 1)
+            except (EnvironmentError, httplib.HTTPException):
+                conn.close()
+                if reused:
+                    continue
+                return None
+            # a body not read to the end leaves the connection unusable
+            if response.will_close or not response.isclosed():
+                conn.close()
+            else:
+                self._release(key, conn)
+            if len(body) > self.max_bytes:
+                body = None
+            charset = None
+            match = RE_CONTENT_CHARSET.search(
+                response.getheader('content-type') or '')
+            if match:
+                charset = match.group(1)
+            return (response.status, response.getheader('location'), charset,
+                body)
+
+    def _acquire(self, key):
+        "Return an idle connection to 'key', or a new one, and whether reused."
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop(), True
+            self.opened += 1
+        return CONNECTIONS[key[0]](key[1], timeout=self.timeout), False
+
+    def _release(self, key, conn):
+        "Keep 'conn' for the next request to 'key', if there is room."
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.connections:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        "Close all idle connections."
+        with self.lock:
+            idle = self.idle
+            self.idle = {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class PageAssembler(object):
+
+    """
+    Assemble the articles of 'readable' spread over several pages, fetching
+    the pages after the first with 'fetcher', up to 'max_pages' pages in
+    all, and extracting them on a pool of 'workers' threads.
+    """
+
+    def __init__(self, readable, fetcher, max_pages=10, workers=4):
+        self.readable = readable
+        self.fetcher = fetcher
+        self.max_pages = max_pages
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        "Stop the threads extracting pages."
+        with self.lock:
+            pool = self.pool
+            self.pool = None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def get_pool(self):
+        "Return the pool of threads extracting pages, started on first use."
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPool(self.workers)
+            return self.pool
+
+    def assemble(self, data, url):
+        """
+        Extract the article of the page 'data', fetched from 'url', and of
+        the pages following it, returning an Assembly. Each page is fetched
+        once the link to it is found, while the pages before it are still
+        being extracted. An error on the first page is raised; a later page
+        that fails is dropped.
+        """
+        # line 1396, the urls of pages part of the article
+        parsed = set([url[:-1] if url.endswith('/') else url])
+        pool = self.get_pool()
+        pages = []
+        # the page that could not be fetched, after all the others
+        failed = []
+        while True:
+            links = queue.Queue()
+            pages.append((url, pool.apply_async(self.grab_page,
+                (data, url, parsed, links))))
+            next_url = links.get()
+            if next_url is None or len(pages) >= self.max_pages:
+                break
+            try:
+                data = self.fetcher.fetch(next_url)
+            except Exception:
+                failed.append((next_url, traceback.format_exc()))
+                break
+            if data is None:
+                failed.append((next_url, 'not fetched'))
+                break
+            url = next_url
+        res = self.join(pages)
+        res.dropped.extend(failed)
+        return res
+
+    def assemble_many(self, items):
+        """
+        Assemble the article of each (data, url) pair of 'items', 'workers'
+        articles at a time, and return the list of Assembly. An error on the
+        first page of any article is raised.
+        """
+        drivers = ThreadPool(self.workers)
+        try:
+            return drivers.map(self._assemble, items)
+        finally:
+            drivers.close()
+            drivers.join()
+
+    def _assemble(self, item):
+        return self.assemble(*item)
+
+    def grab_page(self, data, url, parsed, links):
+        """
+        Return the Article of the page 'data' fetched from 'url'. The url of
+        its next page, not one of 'parsed', is put on the queue 'links' as
+        soon as the page is prepped, or None.
+        """
+        ctx = self.readable.context()
+        prep_document = ctx.prep_document
+        found = []
+
+        def prep_next(data):
+            body = prep_document(data)
+            if not found:
+                # line 1157, on the page as prepped for extraction
+                found.append(ctx.find_next_page_link(body, url, parsed))
+                links.put(found[0])
+            return body
+
+        ctx.prep_document = prep_next
+        try:
+            ctx.grab_steps(data, url)
+        finally:
+            if not found:
+                links.put(None)
+        return ctx.get_article(url)
+
+    def join(self, pages):
+        """
+        Join the content of the (url, AsyncResult) pairs of 'pages' into one
+        Assembly. A page whose first paragraph is part of a page before it
+        repeats that page and is dropped, as are the paragraphs of a page
+        already found on the pages before it.
+        """
+        content = lxml.html.Element('div')
+        first = None
+        urls = []
+        dropped = []
+        # the text of each page kept, and of their paragraphs
+        texts = []
+        paras = set()
+        for url, result in pages:
+            try:
+                article = result.get()
+            except Exception:
+                if first is None:
+                    raise
+                dropped.append((url, traceback.format_exc()))
+                continue
+            page = article.content
+            if first is None:
+                first = article
+            else:
+                para = page.find('.//p')
+                text = para is not None and self.readable.get_inner_text(para)
+                if text and len(text) > MIN_REPEAT_LENGTH and \
+                        any(text in t for t in texts):
+                    dropped.append((url, 'duplicate'))
+                    continue
+            found = []
+            for para in list(page.iter('p')):
+                text = self.readable.get_inner_text(para)
+                if len(text) >= MIN_PARAGRAPH_LENGTH:
+                    if text in paras:
+                        para.drop_tree()
+                        continue
+                    found.append(text)
+            paras.update(found)
+            texts.append(self.readable.get_inner_text(page))
+            urls.append(url)
+
+            num = len(urls)
+            div = lxml.etree.SubElement(content, 'div',
+                {'id': 'readability-page-%d' % num, 'class': 'page'})
+            if num == 1:
+                div.text = page.text
+            else:
+                sep = lxml.etree.SubElement(div, 'p',
+                    {'class': 'page-separator', 'title': 'Page %d' % num})
+                sep.text = u'\xa7'
+                sep.tail = page.text
+            div.extend(list(page))
+        return Assembly(first._replace(content=content), urls, dropped)
@@ -0,0 +1,177 @@
+# std
+import threading
+import unittest
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+# vendor
+import lxml.html
+
+# local
+from readable import core
+from readable import pages
+
+
+URL = 'http://example.com/story'
+SIGNATURE = (u'This story was reported by our correspondent in the city, '
+    u'with additional reporting by the news desk.')
+
+
+def make_page(num, count, first=None):
+    "Page 'num' of a story of 'count' pages, opening with 'first' if given."
+    paras = [u'<p>%s</p>' % (first or text) for text in [u'Part %d of the '
+        u'story, paragraph %d, tells what happened on the day, in some '
+        u'detail, with quotes, names, places and a few numbers like %d.' %
+        (num, i, i * num) for i in range(5)]]
+    paras.append(u'<p>%s</p>' % SIGNATURE)
+    links = [u'<a href="/story%s">%d</a>' % (i > 1 and '/%d' % i or '', i)
+        for i in range(1, count + 1)]
+    if num < count:
+        links.append(u'<a href="/story/%d">Next \xbb</a>' % (num + 1))
+    return (u'<html><head><title>A story told over several pages</title>'
+        u'</head><body><div id="nav"><a href="/">Home</a></div><div '
+        u'class="article">%s</div><div class="pagination">%s</div></body>'
+        u'</html>') % (u''.join(paras), u' '.join(links))
+
+
+def make_pages(count):
+    return dict([('%s/%d' % (URL, num), make_page(num, count))
+        for num in range(2, count + 1)])
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections.append(self.client_address)
+
+    def do_GET(self):
+        if self.path == '/moved':
+            self.send_response(301)
+            self.send_header('Location', '/story/2')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        page = self.server.pages.get('http://example.com' + self.path)
+        if page is None:
+            self.send_error(404)
+            return
+        body = page.encode('cp1251')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=cp1251')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+class TestPages(unittest.TestCase):
+
+    def test_assemble(self):
+        rb = core.Readable()
+        fetcher = pages.DictFetcher(make_pages(3))
+        with pages.PageAssembler(rb, fetcher, workers=2) as assembler:
+            res = assembler.assemble(make_page(1, 3), URL)
+        self.assertEquals(res.urls, [URL, URL + '/2', URL + '/3'])
+        self.assertEquals(res.dropped, [])
+        self.assertEquals(fetcher.fetched, [URL + '/2', URL + '/3'])
+        self.assertEquals(res.article.title, 'A story told over several pages')
+        ids = [div.get('id') for div in res.article.content]
+        self.assertEquals(ids, ['readability-page-%d' % i for i in (1, 2, 3)])
+        text = rb.get_inner_text(res.article.content)
+        for num in (1, 2, 3):
+            self.assertTrue('Part %d of the story, paragraph 4' % num in text)
+        # the paragraph repeated on every page is kept once
+        self.assertEquals(text.count(SIGNATURE), 1)
+        self.assertEquals(len(res.article.content.xpath(
+            './/p[@class="page-separator"]')), 2)
+
+        # each page is the same as extracted alone
+        page = rb.grab_article(make_page(2, 3))
+        exp = [rb.get_inner_text(p) for p in page.iter('p')][:-1]
+        self.assertEquals([rb.get_inner_text(p) for p in
+            res.article.content[1].iter('p')][1:], exp)
+
+    def test_stops(self):
+        rb = core.Readable()
+        # page 3 repeats page 2, page 4 cannot be fetched
+        docs = make_pages(4)
+        first = lxml.html.fromstring(docs[URL + '/2']).find('.//p')
+        docs[URL + '/3'] = make_page(3, 4, rb.get_inner_text(first))
+        del docs[URL + '/4']
+        with pages.PageAssembler(rb, pages.DictFetcher(docs)) as assembler:
+            res = assembler.assemble(make_page(1, 4), URL)
+            self.assertEquals(res.urls, [URL, URL + '/2'])
+            self.assertEquals(res.dropped, [(URL + '/3', 'duplicate'),
+                (URL + '/4', 'not fetched')])
+
+            fetcher = pages.DictFetcher(make_pages(5))
+            assembler = pages.PageAssembler(rb, fetcher, max_pages=2)
+            res = assembler.assemble(make_page(1, 5), URL)
+            self.assertEquals(res.urls, [URL, URL + '/2'])
+            self.assertEquals(fetcher.fetched, [URL + '/2'])
+            assembler.close()
+
+            # a single page article, and a page that cannot be extracted
+            res = assembler.assemble(make_page(1, 1), URL)
+            self.assertEquals((res.urls, res.dropped), ([URL], []))
+            self.assertRaises(Exception, assembler.assemble, u'', URL)
+
+    def test_assemble_many(self):
+        rb = core.Readable()
+        docs = make_pages(3)
+        for num in (2, 3):
+            docs['http://example.com/other/%d' % num] = \
+                docs['%s/%d' % (URL, num)].replace('/story', '/other')
+        fetcher = pages.DictFetcher(docs)
+        with pages.PageAssembler(rb, fetcher) as assembler:
+            res = assembler.assemble_many([(make_page(1, 3), URL),
+                (make_page(1, 3).replace('/story', '/other'),
+                'http://example.com/other')])
+        self.assertEquals([r.urls for r in res], [
+            [URL, URL + '/2', URL + '/3'], ['http://example.com/other',
+            'http://example.com/other/2', 'http://example.com/other/3']])
+        self.assertEquals(len(fetcher.fetched), 4)
+
+    def test_http_fetcher(self):
+        server = Server(('127.0.0.1', 0), Handler)
+        server.pages = make_pages(3)
+        server.connections = []
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        base = 'http://127.0.0.1:%d' % server.server_address[1]
+        fetcher = pages.HTTPFetcher(timeout=5)
+        try:
+            for path in ('/story/2', '/story/3', '/moved'):
+                page = fetcher.fetch(base + path)
+                exp = server.pages['http://example.com' + path.replace(
+                    'moved', 'story/2')]
+                self.assertEquals(page, exp)
+            self.assertEquals(fetcher.fetch(base + '/missing'), None)
+            self.assertEquals(fetcher.fetch('ftp://127.0.0.1/story/2'), None)
+            # all requests went over one connection
+            self.assertEquals(fetcher.opened, 1)
+            self.assertEquals(len(server.connections), 1)
+        finally:
+            fetcher.close()
+            server.shutdown()
+            server.server_close()
+        self.assertEquals(fetcher.fetch(base + '/story/2'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
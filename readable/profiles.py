@@ -0,0 +1,122 @@
+"""
+readable site profiles.
+
+Pages of a site share a layout, so the node holding the content of one page
+is usually found at the same place on the next. A Readable built with a
+profile store remembers, per host, where the content was found and which
+extraction flags found it, and tries that place first on the next page from
+the host:
+
+    profiles = SiteProfiles()
+    readable = Readable(profiles=profiles)
+    for url, page in crawl():
+        readable.extract(page, url=url)
+
+The remembered node is scored along with its siblings only, under the flags
+that found it. It is kept when it wins that scoring and holds enough text,
+otherwise the page goes through the full extraction, which updates the
+profile. See 'Readable.grab_article'.
+
+Any object with the methods of SiteProfiles below can be used as a store.
+"""
+
+# std
+import collections
+import threading
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+
+class Profile(collections.namedtuple('Profile', 'path flags')):
+
+    """
+    Where the content of a site was found: 'path' is the signature path of
+    the top node from the body, as made by 'Readable.get_signature_path',
+    and 'flags' the extraction flags of the pass that found it.
+    """
+
+    __slots__ = ()
+
+
+def host_of(url):
+    "Return the lowercased host name of 'url', or None."
+    try:
+        return urlsplit(url).hostname
+    except ValueError:
+        return None
+
+
+class SiteProfiles(object):
+
+    """
+    A thread safe store of the Profile of at most 'size' hosts, the least
+    recently used being dropped first. Profiles learned in the processes of
+    'Readable.extract_many' stay in those processes.
+
+    'hits' counts pages extracted with a profile, 'fallbacks' pages whose
+    profile failed the check, and 'misses' pages of hosts without a profile.
+    """
+
+    def __init__(self, size=10000):
+        self.size = size
+        self.lock = threading.Lock()
+        self.clear()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def clear(self):
+        "Drop all profiles and reset the counters."
+        self.profiles = collections.OrderedDict()
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+
+    def lookup(self, url):
+        "Return the Profile for the host of 'url', or None."
+        host = host_of(url)
+        with self.lock:
+            profile = self.profiles.pop(host, None)
+            if profile is None:
+                self.misses += 1
+                return None
+            self.profiles[host] = profile
+            return profile
+
+    def report(self, url, accepted):
+        "Record whether the profile returned for 'url' was 'accepted'."
+        with self.lock:
+            if accepted:
+                self.hits += 1
+            else:
+                self.fallbacks += 1
+
+    def learn(self, url, path, flags):
+        """
+        Remember that the content of 'url' was found at the signature path
+        'path' with 'flags', or forget its host when 'path' is None.
+        """
+        host = host_of(url)
+        if host is None:
+            return
+        with self.lock:
+            self.profiles.pop(host, None)
+            if path is None:
+                return
+            self.profiles[host] = Profile(tuple(path), flags)
+            while len(self.profiles) > self.size:
+                self.profiles.popitem(last=False)
+
+    def stats(self):
+        "Return a dict of the 'hits', 'fallbacks', 'misses' and 'hosts'."
+        with self.lock:
+            return {'hits': self.hits, 'fallbacks': self.fallbacks,
+                'misses': self.misses, 'hosts': len(self.profiles)}
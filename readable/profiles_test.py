@@ -0,0 +1,105 @@
+
+
+# std
+import os
+import pickle
+import unittest
+
+# vendor
+import lxml.html
+
+# local
+from readable import core
+from readable import metrics
+from readable import profiles
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_data(name):
+    path = os.path.join(ROOT, 'testdata', name)
+    fh = open(path, 'rb')
+    data = fh.read()
+    fh.close()
+    return data
+
+
+class TestProfiles(unittest.TestCase):
+
+    def test_signature_path(self):
+        rb = core.Readable()
+        body = lxml.html.fromstring('<html><body><div class="a">x</div>'
+            '<div class="sidebar">y</div><div class="a"><p>1</p><p id="b">'
+            '2</p><p id="b">3</p></div></body></html>').find('body')
+        node = body.xpath('//p')[2]
+        path = rb.get_signature_path(node)
+        self.assertEquals(path, (('div', 'a', '', 1), ('p', '', 'b', 1)))
+        self.assertTrue(rb.find_signature_path(body, path) is node)
+        # other siblings come and go
+        body.remove(body[1])
+        body[1].insert(0, lxml.html.Element('p'))
+        self.assertTrue(rb.find_signature_path(body, path) is node)
+        self.assertEquals(rb.find_signature_path(body,
+            (('div', 'a', '', 2),)), None)
+        self.assertEquals(rb.find_signature_path(body,
+            (('p', 'a', '', 0),)), None)
+
+    def test_extract(self):
+        article = get_data('article.html')
+        other = get_data(os.path.join('corpus', 'news.html'))
+        plain = core.Readable()
+        store = profiles.SiteProfiles()
+        sink = metrics.Metrics()
+        rb = core.Readable(profiles=store, metrics=sink)
+        self.assertEquals(rb.extract(article, url='http://a.com/1'),
+            plain.extract(article))
+        profile = store.lookup('http://A.com/')
+        # found by the second pass
+        self.assertEquals(profile.flags,
+            0xFFFF & ~core.Readable.FLAG_STRIP_UNLIKELY)
+        store.clear()
+        rb.extract(article, url='http://a.com/1')
+        self.assertEquals(rb.extract(article, url='http://a.com/2'),
+            plain.extract(article))
+        self.assertEquals(store.stats(), {'hits': 1, 'fallbacks': 0,
+            'misses': 1, 'hosts': 1})
+
+        # a page of another layout is extracted in full, and relearned from
+        self.assertEquals(rb.extract(other, url='http://a.com/3'),
+            plain.extract(other))
+        self.assertEquals(store.stats()['fallbacks'], 1)
+        self.assertNotEquals(store.lookup('http://a.com/'), profile)
+        self.assertEquals(rb.extract(other, url='http://a.com/4'),
+            plain.extract(other))
+        self.assertEquals(store.stats()['hits'], 2)
+        counters = dict((c['name'], c['value'])
+            for c in sink.as_dict()['counters'] if not c['labels'])
+        self.assertEquals(counters['readable_profile_hits_total'], 2)
+        self.assertEquals(counters['readable_profile_fallbacks_total'], 1)
+
+        # too little text to learn from
+        rb.extract(get_data('breaks_t.html'), url='http://a.com/5')
+        self.assertEquals(store.stats()['hosts'], 0)
+        # no url, no profile
+        rb.extract(article)
+        self.assertEquals(store.stats()['misses'], 1)
+
+    def test_store(self):
+        store = profiles.SiteProfiles(size=2)
+        for host in ('a', 'b', 'c'):
+            store.learn('http://%s/x' % host, [('div', '', '', 0)], 1)
+        self.assertEquals(sorted(store.profiles), ['b', 'c'])
+        store.learn('http://b/y', None, 1)
+        self.assertEquals(list(store.profiles), ['c'])
+        store.learn('not a url', [('div', '', '', 0)], 1)
+        copy = pickle.loads(pickle.dumps(store))
+        self.assertEquals(copy.profiles, store.profiles)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -17,7 +17,10 @@ def main():
         maintainer_email = 'spaceboy@indirect.com',
         packages = ['readable'],
         package_data = {
-            'readable': ['testdata/*.html']
+            'readable': ['testdata/*.html', 'testdata/corpus/*.html']
+            },
+        entry_points = {
+            'console_scripts': ['readable = readable.cli:main']
             }
     )
 